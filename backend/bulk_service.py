@@ -0,0 +1,291 @@
+import codecs
+import csv
+import io
+import json
+from collections import Counter, deque
+from typing import AsyncIterator, Dict, List, Optional
+from pydantic import ValidationError
+from starlette.responses import StreamingResponse
+from models import DecompressionRequest, DecompressionResult
+from decompression_service import decompression_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+CSV_INPUT_TYPES = ("text/csv", "application/csv")
+NDJSON_INPUT_TYPES = ("application/x-ndjson", "application/ndjson", "application/jsonl")
+
+BULK_CSV_COLUMNS = [
+    "row",
+    "maxDepth",
+    "bottomTime",
+    "roundedDepth",
+    "roundedTime",
+    "noDecompressionDive",
+    "decompressionStops",
+    "totalAscentTime",
+    "repetitiveGroup",
+    "timeToFirstStop",
+    "error",
+]
+
+# A quoted CSV field may span at most this many lines / characters; beyond that the
+# quote is taken to be stray, its row is reported and parsing resumes on the next line
+MAX_CSV_RECORD_LINES = 50
+MAX_CSV_RECORD_CHARS = 64 * 1024
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Split an incoming byte stream into decoded text lines as it arrives"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+
+    async for chunk in chunks:
+        pending += decoder.decode(chunk)
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line.rstrip("\r")
+
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending.rstrip("\r")
+
+
+class CsvRecordSplitter:
+    """
+    Joins physical lines into CSV records, so a quoted field may contain
+    newlines. Quote parity is tracked per line, and a record that stays open
+    past MAX_CSV_RECORD_LINES / MAX_CSV_RECORD_CHARS is emitted as None (an
+    unterminated quote); the lines after its first one are parsed again.
+    """
+
+    def __init__(self, max_lines: int = MAX_CSV_RECORD_LINES, max_chars: int = MAX_CSV_RECORD_CHARS):
+        self.max_lines = max_lines
+        self.max_chars = max_chars
+        self._reset()
+
+    def _reset(self):
+        self._lines: List[str] = []
+        self._chars = 0
+        self._quoted = False
+
+    def feed(self, line: str) -> List[Optional[str]]:
+        records = []
+        pending = deque([line])
+        while pending:
+            line = pending.popleft()
+            self._lines.append(line)
+            self._chars += len(line)
+            if line.count('"') % 2:
+                self._quoted = not self._quoted
+
+            if not self._quoted:
+                records.append("\n".join(self._lines))
+                self._reset()
+            elif len(self._lines) > self.max_lines or self._chars > self.max_chars:
+                pending.extendleft(reversed(self._lines[1:]))
+                self._reset()
+                records.append(None)
+        return records
+
+    def close(self) -> List[Optional[str]]:
+        """Records left at the end of the input; a still-open quote is reported as above"""
+        records = []
+        while self._lines:
+            remaining = self._lines[1:]
+            self._reset()
+            records.append(None)
+            for line in remaining:
+                records.extend(self.feed(line))
+        return records
+
+
+async def iter_csv_records(lines: AsyncIterator[str]) -> AsyncIterator[Optional[str]]:
+    """CSV records (None for an unterminated quote) from a stream of lines"""
+    splitter = CsvRecordSplitter()
+    async for line in lines:
+        for record in splitter.feed(line):
+            yield record
+    for record in splitter.close():
+        yield record
+
+
+def detect_format(content_type: Optional[str], default: str = "ndjson") -> str:
+    """Map a Content-Type / Accept header to "csv" or "ndjson" """
+    value = (content_type or "").lower()
+    if any(media_type in value for media_type in CSV_INPUT_TYPES):
+        return "csv"
+    if any(media_type in value for media_type in NDJSON_INPUT_TYPES):
+        return "ndjson"
+    return default
+
+
+class RequestBodyStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse whose body iterator reads the request body itself.
+
+    The stock response listens for client disconnects on ``receive`` while it
+    streams, which would swallow request body chunks the iterator is still
+    waiting for. A disconnect still surfaces as ClientDisconnect from
+    ``request.stream()``.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+class BulkCalculationService:
+    def __init__(self, service=decompression_service):
+        self.service = service
+
+    async def parse_rows(self, lines: AsyncIterator[str], input_format: str) -> AsyncIterator[Dict]:
+        """
+        Turn CSV or NDJSON lines into raw row dicts, one at a time. Empty CSV
+        cells are left out so the request model's defaults apply, and a quoted
+        CSV field may span several lines (see CsvRecordSplitter).
+        """
+        if input_format == "csv":
+            header: Optional[List[str]] = None
+            async for record in iter_csv_records(lines):
+                if record is None:
+                    yield {"__error__": "CSV inválido: comillas sin cerrar"}
+                    continue
+                if not record.strip():
+                    continue
+                values = [value.strip() for value in next(csv.reader([record]))]
+                if header is None:
+                    header = values
+                    continue
+                yield {column: value for column, value in zip(header, values) if value != ""}
+            return
+
+        async for line in lines:
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"__error__": f"JSON inválido: {e.msg}"}
+                continue
+            if not isinstance(row, dict):
+                yield {"__error__": "Cada línea debe ser un objeto JSON"}
+                continue
+            yield row
+
+    def calculate_row(self, row: Dict) -> DecompressionResult:
+        """Validate a raw row and run it through the decompression engine"""
+        if "__error__" in row:
+            raise Exception(row["__error__"])
+
+        try:
+            request = DecompressionRequest(**row)
+        except ValidationError as e:
+            details = "; ".join(
+                f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in e.errors()
+            )
+            raise Exception(f"Fila inválida: {details}")
+
+        return self.service.calculate_decompression(
+            max_depth=request.maxDepth,
+            bottom_time=request.bottomTime,
+            altitude=request.altitude,
+            breathing_gas=request.breathingGas,
+            oxygen_deco=request.oxygenDeco,
+            include_hints=request.includeScheduleHints,
+            table_revision=request.tableRevision,
+            include_oxygen_exposure=request.includeOxygenExposure
+        )
+
+    def get_result_mode(self, result: DecompressionResult) -> str:
+        """Classify a result for the summary trailer"""
+        if result.noDecompressionDive:
+            return "sin_descompresion"
+        if result.oxygenDeco.strip().lower() in ("yes", "si", "sí"):
+            return "descompresion_o2"
+        return "descompresion_aire"
+
+    def format_record(self, output_format: str, record: Dict) -> str:
+        """Serialize one output record (result, error or summary)"""
+        if output_format == "ndjson":
+            return json.dumps(record, ensure_ascii=False) + "\n"
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator="\n")
+
+        if "summary" in record:
+            buffer.write("# summary: " + json.dumps(record["summary"], ensure_ascii=False) + "\n")
+            return buffer.getvalue()
+
+        result = record.get("result")
+        if result is None:
+            writer.writerow([record["row"], "", "", "", "", "", "", "", "", "", record["error"]])
+        else:
+            stops = ";".join(f"{stop['depth']}:{stop['duration']:g}" for stop in result["decompressionStops"])
+            writer.writerow([
+                record["row"],
+                result["actualInputs"]["depth"],
+                result["actualInputs"]["bottomTime"],
+                result["roundedValues"]["depth"],
+                result["roundedValues"]["time"],
+                result["noDecompressionDive"],
+                stops,
+                result["totalAscentTime"],
+                result["repetitiveGroup"],
+                result["timeToFirstStop"],
+                "",
+            ])
+        return buffer.getvalue()
+
+    async def stream_results(
+        self,
+        chunks: AsyncIterator[bytes],
+        input_format: str,
+        output_format: str
+    ) -> AsyncIterator[str]:
+        """
+        Parse the upload as it arrives and stream one output record per input row,
+        in input order, followed by a summary trailer
+        """
+        totals = Counter()
+        by_mode = Counter()
+        by_group = Counter()
+
+        if output_format == "csv":
+            buffer = io.StringIO()
+            csv.writer(buffer, lineterminator="\n").writerow(BULK_CSV_COLUMNS)
+            yield buffer.getvalue()
+
+        row_number = 0
+        async for row in self.parse_rows(iter_lines(chunks), input_format):
+            row_number += 1
+            totals["rows"] += 1
+            try:
+                result = self.calculate_row(row)
+            except Exception as e:
+                totals["errors"] += 1
+                yield self.format_record(output_format, {"row": row_number, "error": str(e)})
+                continue
+
+            totals["ok"] += 1
+            by_mode[self.get_result_mode(result)] += 1
+            by_group[result.repetitiveGroup] += 1
+            yield self.format_record(output_format, {"row": row_number, "result": result.model_dump()})
+
+        logger.info(f"Bulk calculation finished: {totals['rows']} rows, {totals['errors']} errors")
+
+        yield self.format_record(output_format, {
+            "summary": {
+                "rows": totals["rows"],
+                "ok": totals["ok"],
+                "errors": totals["errors"],
+                "byMode": dict(sorted(by_mode.items())),
+                "byRepetitiveGroup": dict(sorted(by_group.items())),
+            }
+        })
+
+
+# Global service instance
+bulk_service = BulkCalculationService()
@@ -0,0 +1,123 @@
+import gzip
+import hashlib
+import json
+import threading
+from typing import Callable, Dict, Hashable, Optional
+from starlette.requests import Request
+from starlette.responses import Response
+import logging
+
+try:
+    import brotli
+except ImportError:  # brotli is optional; gzip is always available
+    brotli = None
+
+logger = logging.getLogger(__name__)
+
+# Bodies smaller than this are served as-is: compression would not pay for itself
+MIN_COMPRESS_BYTES = 1024
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11
+# Parameterised payloads (e.g. planning cards per bottom time) are bounded; oldest go first
+MAX_PAYLOADS = 256
+
+
+class PrecompressedBody:
+    """A JSON body with its gzip / brotli encodings, compressed once"""
+
+    def __init__(self, body: bytes, media_type: str = "application/json"):
+        self.media_type = media_type
+        self.encodings: Dict[str, bytes] = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            # mtime=0 keeps the gzip bytes identical across workers
+            self.encodings["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        # Strong validators must differ between content-codings of the same body
+        digest = hashlib.sha256(body).hexdigest()[:32]
+        self.etags: Dict[str, str] = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.encodings
+        }
+
+    def negotiate(self, accept_encoding: Optional[str]) -> str:
+        """Smallest available encoding the client accepts (q > 0), else identity"""
+        accepted: Dict[str, float] = {}
+        for part in (accept_encoding or "").split(","):
+            coding, _, params = part.strip().partition(";")
+            if not coding:
+                continue
+            quality = 1.0
+            params = params.strip()
+            if params.startswith("q="):
+                try:
+                    quality = float(params[2:])
+                except ValueError:
+                    quality = 0.0
+            accepted[coding.strip().lower()] = quality
+
+        candidates = [
+            encoding for encoding in self.encodings
+            if encoding != "identity" and accepted.get(encoding, accepted.get("*", 0.0)) > 0
+        ]
+        if not candidates:
+            return "identity"
+        return min(candidates, key=lambda encoding: len(self.encodings[encoding]))
+
+    @staticmethod
+    def not_modified(if_none_match: Optional[str], etag: str) -> bool:
+        """If-None-Match check: "*" or any listed tag, compared weakly (W/ ignored)"""
+        for tag in (if_none_match or "").split(","):
+            tag = tag.strip()
+            if tag == "*" or tag.removeprefix("W/") == etag:
+                return True
+        return False
+
+    def response(self, request: Request) -> Response:
+        encoding = self.negotiate(request.headers.get("accept-encoding"))
+        headers = {"ETag": self.etags[encoding], "Vary": "Accept-Encoding"}
+        if self.not_modified(request.headers.get("if-none-match"), self.etags[encoding]):
+            return Response(status_code=304, headers=headers)
+
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        return Response(content=self.encodings[encoding], media_type=self.media_type, headers=headers)
+
+
+class PrecompressedPayloadService:
+    """
+    Static, table-derived payloads serialized and compressed once per key.
+
+    Keys include the table revision content hash, so a new table version
+    gets new bodies while the old ones are simply never asked for again.
+    """
+
+    def __init__(self):
+        self._bodies: Dict[Hashable, PrecompressedBody] = {}
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, build: Callable[[], object]) -> PrecompressedBody:
+        """Body for key, building it with build() (a pydantic model or JSON-serializable value) on first use"""
+        body = self._bodies.get(key)
+        if body is None:
+            payload = build()
+            if hasattr(payload, "model_dump_json"):
+                raw = payload.model_dump_json().encode("utf-8")
+            else:
+                raw = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            body = PrecompressedBody(raw)
+            with self._lock:
+                body = self._bodies.setdefault(key, body)
+                while len(self._bodies) > MAX_PAYLOADS:
+                    del self._bodies[next(iter(self._bodies))]
+            logger.info(f"Precompressed payload {key}: " + ", ".join(
+                f"{encoding} {len(data)} B" for encoding, data in body.encodings.items()
+            ))
+        return body
+
+    def response(self, request: Request, key: Hashable, build: Callable[[], object]) -> Response:
+        return self.get(key, build).response(request)
+
+
+# Global service instance
+payload_service = PrecompressedPayloadService()
@@ -0,0 +1,38 @@
+import os
+from typing import Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+import logging
+
+logger = logging.getLogger(__name__)
+
+_client: Optional[AsyncIOMotorClient] = None
+
+
+def get_client() -> AsyncIOMotorClient:
+    """
+    Create the shared, pooled Mongo client on first use.
+
+    Motor connects lazily, so nothing here touches the network; a missing or
+    slow Mongo only affects the requests that actually need it.
+    """
+    global _client
+    if _client is None:
+        _client = AsyncIOMotorClient(
+            os.environ['MONGO_URL'],
+            maxPoolSize=int(os.environ.get('MONGO_MAX_POOL_SIZE', '100')),
+            minPoolSize=int(os.environ.get('MONGO_MIN_POOL_SIZE', '0')),
+            serverSelectionTimeoutMS=int(os.environ.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+        )
+        logger.info("Created MongoDB client")
+    return _client
+
+
+def get_db() -> AsyncIOMotorDatabase:
+    return get_client()[os.environ['DB_NAME']]
+
+
+def close_client():
+    global _client
+    if _client is not None:
+        _client.close()
+        _client = None
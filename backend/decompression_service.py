@@ -1,40 +1,391 @@
+import hashlib
 import json
+import math
 import os
-from typing import List, Optional
-from models import TableEntry, DecompressionResult, DecompressionStop, ActualInputs, RoundedValues
+import re
+import threading
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from models import (
+    TableEntry, DecompressionResult, DecompressionStop, ActualInputs, RoundedValues,
+    CellSummary, ScheduleHints, SchedulePhase, DiveSchedule, GasCheck,
+    OxygenExposure, DailyExposureDive, DailyExposureDiveResult, DailyExposure, TableGrid, TableGridCell
+)
+from oxygen_exposure import (
+    METERS_PER_ATMOSPHERE, phases_exposure, bottom_exposure, accumulate_daily, build_exposure,
+    exposure_warnings, minutes_above_noaa_range
+)
 import logging
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_TABLE_NAME = "US Navy Rev 7 – Tabla de Aire I"
+DEFAULT_TABLE_PATH = os.path.join(os.path.dirname(__file__), '..', 'decompression_table.json')
+# Optional directory of extra revisions: one JSON file per revision, either a
+# list of rows (named after the file) or {"name": ..., "rows": [...]}
+TABLE_REVISIONS_DIR = os.environ.get('TABLE_REVISIONS_DIR')
+
+DECOMPRESSION_MODES = ('aire', 'o2_agua', 'surdo2')
+
+ASCENT_RATE = 9.0  # m/min in the water
+SURDO2_SURFACE_ASCENT_RATE = 12.0  # m/min from 12.2 m to the surface
+CHAMBER_RATE = 30.0  # m/min chamber compression and travel
+CHAMBER_DEPTH = 15.0
+O2_STOP_MAX_DEPTH = 9.1  # in-water O2 is breathed at the 9.1 m and 6.1 m stops
+SURDO2_LAST_WATER_STOP = 12.2
+O2_PERIOD_MINUTES = 30
+AIR_BREAK_MINUTES = 5
+O2_FINAL_SEGMENT_MAX_MINUTES = 35
+
+AIR_GAS_NAMES = ('air', 'aire')
+AIR_OXYGEN_FRACTION = 0.21
+AIR_NITROGEN_FRACTION = 0.79
+NITROX_MAX_OXYGEN_FRACTION = 0.40
+PPO2_WORKING_LIMIT = 1.4  # ata, planned maximum (defines the MOD)
+PPO2_MAX = 1.6  # ata, never exceeded
+# Mixes whose EAD thresholds are built with every revision; others on first use
+COMMON_NITROX_MIXES = (0.32, 0.36)
+
+def parse_breathing_gas(breathing_gas: str) -> float:
+    """Oxygen fraction of "Air"/"Aire" or a nitrox mix such as "EAN32", "Nitrox 36" or "32%" """
+    name = re.sub(r'[\s_-]', '', (breathing_gas or '').lower())
+    if name in AIR_GAS_NAMES:
+        return AIR_OXYGEN_FRACTION
+    match = re.fullmatch(r'(?:eanx?|nitrox|nx)?(\d{2})%?', name)
+    if not match:
+        raise Exception(f"Gas respirable no soportado: {breathing_gas}")
+    oxygen_fraction = int(match.group(1)) / 100
+    if not AIR_OXYGEN_FRACTION <= oxygen_fraction <= NITROX_MAX_OXYGEN_FRACTION:
+        raise Exception(f"Mezcla nitrox fuera de rango (21-40% O₂): {breathing_gas}")
+    return oxygen_fraction
+
+def equivalent_air_depth(depth: float, oxygen_fraction: float) -> float:
+    """Depth at which air has the same nitrogen partial pressure as the mix at depth"""
+    return (depth + METERS_PER_ATMOSPHERE) * (1 - oxygen_fraction) / AIR_NITROGEN_FRACTION - METERS_PER_ATMOSPHERE
+
+def max_operating_depth(oxygen_fraction: float, ppo2_limit: float = PPO2_WORKING_LIMIT) -> float:
+    return (ppo2_limit / oxygen_fraction - 1) * METERS_PER_ATMOSPHERE
+
+def partial_pressure_o2(depth: float, oxygen_fraction: float) -> float:
+    return (depth / METERS_PER_ATMOSPHERE + 1) * oxygen_fraction
+
+def hash_content(value) -> str:
+    """SHA-256 of the canonical JSON form of a row or table"""
+    canonical = json.dumps(value, sort_keys=True, ensure_ascii=False, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+class TableRow:
+    """A parsed table row and its derived data, shared by every revision containing it"""
+
+    def __init__(self, entry: TableEntry, stops: List[DecompressionStop]):
+        self.entry = entry
+        self.stops = stops
+        self.no_deco = len(stops) == 0
+        self.mode = self._get_mode(entry)
+        self.summary = CellSummary(
+            depth=entry.profundidad_m,
+            time=entry.tiempo_fondo_min,
+            noDecompressionDive=self.no_deco,
+            decompressionStops=stops,
+            totalAscentTime=entry.tiempo_total_ascenso,
+            repetitiveGroup=entry.grupo_repeticion
+        )
+
+    def _get_mode(self, entry: TableEntry) -> Optional[str]:
+        """Decompression mode flagged "Si" on this row, None for no-decompression rows"""
+        flags = (
+            ('aire', entry.descompresion_aire),
+            ('o2_agua', entry.descompresion_o2_agua),
+            ('surdo2', entry.descompresion_superficie),
+        )
+        for mode, flag in flags:
+            if flag == 'Si':
+                return mode
+        return None
+
+class TableCell:
+    """One depth/time cell of a revision: the shared row plus its neighbours in that revision"""
+
+    def __init__(self, row: TableRow):
+        self.row = row
+        self.entry = row.entry
+        self.stops = row.stops
+        self.no_deco = row.no_deco
+        self.summary = row.summary
+        self.modes: Dict[str, TableRow] = {}
+        self.next_longer: Optional[CellSummary] = None
+        self.next_deeper: Optional[CellSummary] = None
+        # Exposure of each (mode, bottom gas O2 fraction) schedule from the cell depth,
+        # filled on demand or by precompute (air)
+        self.oxygen_exposure: Dict[Tuple[str, float], Optional[OxygenExposure]] = {}
+
+class TableRevision:
+    """A loaded table revision with its own depth/time index"""
+
+    def __init__(self, name: str, content_hash: str, rows: List[TableRow]):
+        self.name = name
+        self.content_hash = content_hash
+        self.short_hash = content_hash[:12]
+        self.rows = rows
+        self.table_data = [row.entry for row in rows]
+        self._build_index()
+        self._gas_thresholds: Dict[float, List[float]] = {}
+        for oxygen_fraction in COMMON_NITROX_MIXES:
+            self.gas_thresholds(oxygen_fraction)
+
+    def gas_thresholds(self, oxygen_fraction: float) -> List[float]:
+        """
+        Deepest real depth (cm resolution, rounded down) whose EAD still fits
+        each table depth, so a nitrox lookup is a single bisect on real depth
+        """
+        thresholds = self._gas_thresholds.get(oxygen_fraction)
+        if thresholds is None:
+            thresholds = [
+                math.floor(((depth + METERS_PER_ATMOSPHERE) * AIR_NITROGEN_FRACTION / (1 - oxygen_fraction)
+                            - METERS_PER_ATMOSPHERE) * 100) / 100
+                for depth in self.depths
+            ]
+            self._gas_thresholds[oxygen_fraction] = thresholds
+        return thresholds
+
+    def table_depth_for_gas(self, real_depth: float, oxygen_fraction: float) -> float:
+        """Air table depth for a nitrox dive: the EAD rounded up to the next table depth"""
+        thresholds = self.gas_thresholds(oxygen_fraction)
+        position = bisect_left(thresholds, real_depth)
+        return self.depths[position] if position < len(self.depths) else self.depths[-1]
+
+    def _build_index(self):
+        """
+        Index the table by depth and link every cell to its next-longer /
+        next-deeper neighbours. The first row for a depth/time pair wins,
+        matching the linear lookup kept as the oracle in differential_fuzz.py.
+        """
+        cells: Dict[Tuple[float, int], TableCell] = {}
+        for row in self.rows:
+            key = (row.entry.profundidad_m, row.entry.tiempo_fondo_min)
+            if key not in cells:
+                cells[key] = TableCell(row)
+            if row.mode and row.mode not in cells[key].modes:
+                cells[key].modes[row.mode] = row
+
+        times_by_depth: Dict[float, List[int]] = {}
+        for depth, time in cells:
+            times_by_depth.setdefault(depth, []).append(time)
+        for times in times_by_depth.values():
+            times.sort()
+
+        depths = sorted(times_by_depth)
+        for depth_index, depth in enumerate(depths):
+            times = times_by_depth[depth]
+            deeper = depths[depth_index + 1] if depth_index + 1 < len(depths) else None
+            for time_index, time in enumerate(times):
+                cell = cells[(depth, time)]
+                if time_index + 1 < len(times):
+                    cell.next_longer = cells[(depth, times[time_index + 1])].summary
+                if deeper is not None:
+                    deeper_times = times_by_depth[deeper]
+                    position = bisect_left(deeper_times, time)
+                    if position < len(deeper_times):
+                        cell.next_deeper = cells[(deeper, deeper_times[position])].summary
+
+        self.cells = cells
+        self.depths = depths
+        self.times_by_depth = times_by_depth
+
+class TableRegistry:
+    """
+    Table revisions keyed by name and content hash. Rows are interned by
+    content hash, so identical rows are parsed once and shared across
+    revisions; only each revision's index is per revision.
+    """
+
+    def __init__(self, extract_stops):
+        self.extract_stops = extract_stops
+        self.default_name: Optional[str] = None
+        self._rows: Dict[str, TableRow] = {}
+        self._by_name: Dict[str, TableRevision] = {}
+        self._by_hash: Dict[str, TableRevision] = {}
+
+    def register(self, name: str, raw_rows: List[dict], default: bool = False) -> TableRevision:
+        """
+        Parse and index a revision, reusing rows already known from other
+        revisions. Only a default registration may replace the default table.
+        """
+        if name == self.default_name and not default:
+            raise Exception(f"La revisión '{name}' tiene el mismo nombre que la tabla por defecto")
+
+        rows = []
+        row_hashes = []
+        for raw_row in raw_rows:
+            row_hash = hash_content(raw_row)
+            row = self._rows.get(row_hash)
+            if row is None:
+                try:
+                    entry = TableEntry(**raw_row)
+                except Exception as e:
+                    logger.warning(f"Skipped invalid table entry: {e}")
+                    continue
+                row = TableRow(entry, self.extract_stops(entry))
+                self._rows[row_hash] = row
+            rows.append(row)
+            row_hashes.append(row_hash)
+
+        revision = TableRevision(name, hash_content(row_hashes), rows)
+        previous = self._by_name.get(name)
+        if previous is not None:
+            for key in (previous.content_hash, previous.short_hash):
+                if self._by_hash.get(key) is previous:
+                    del self._by_hash[key]
+        self._by_name[name] = revision
+        # Identical content is shared: a hash keeps pointing to the first revision that had it
+        for owner in self._by_name.values():
+            self._by_hash.setdefault(owner.content_hash, owner)
+            self._by_hash.setdefault(owner.short_hash, owner)
+        if default or self.default_name is None:
+            self.default_name = name
+
+        logger.info(f"Registered table '{name}' ({revision.short_hash}): {len(rows)} entries, {len(self._rows)} unique rows in registry")
+        return revision
+
+    def get(self, key: Optional[str] = None) -> TableRevision:
+        """Look up a revision by name or content hash; None selects the default"""
+        if key is None:
+            key = self.default_name
+        revision = self._by_name.get(key) or self._by_hash.get(key)
+        if revision is None:
+            raise Exception(f"Revisión de tabla desconocida: {key}")
+        return revision
+
+    def list_revisions(self) -> List[TableRevision]:
+        return list(self._by_name.values())
+
+    @property
+    def unique_rows(self) -> int:
+        return len(self._rows)
+
 class DecompressionService:
     def __init__(self):
-        self.table_data = self._load_decompression_table()
+        # Tables are loaded on first use (or by the app lifespan), not at import time
+        self._registry: Optional[TableRegistry] = None
+        self._load_lock = threading.Lock()
+        # Set on the warming thread so warmup logs one summary instead of a line per calculation
+        self._warming = threading.local()
     
-    def _load_decompression_table(self) -> List[TableEntry]:
-        """Load the US Navy Rev 7 decompression table from JSON"""
-        table_path = os.path.join(os.path.dirname(__file__), '..', 'decompression_table.json')
-        
+    def load(self) -> TableRegistry:
+        """Load and index the default table and any extra revisions; idempotent"""
+        with self._load_lock:
+            if self._registry is None:
+                registry = TableRegistry(self.extract_decompression_stops)
+                registry.register(DEFAULT_TABLE_NAME, self._load_decompression_table(), default=True)
+                if TABLE_REVISIONS_DIR:
+                    self.load_revisions(TABLE_REVISIONS_DIR, registry)
+                self._registry = registry
+        return self._registry
+    
+    @property
+    def loaded(self) -> bool:
+        return self._registry is not None
+    
+    @property
+    def registry(self) -> TableRegistry:
+        return self._registry if self._registry is not None else self.load()
+    
+    @property
+    def table_data(self) -> List[TableEntry]:
+        return self.registry.get().table_data
+    
+    def _load_decompression_table(self, table_path: str = DEFAULT_TABLE_PATH) -> List[dict]:
+        """Load the raw rows of a decompression table from JSON"""
         try:
             with open(table_path, 'r', encoding='utf-8') as f:
                 raw_data = json.load(f)
             
-            # Convert to TableEntry objects
-            table_entries = []
-            for entry in raw_data:
-                try:
-                    table_entry = TableEntry(**entry)
-                    table_entries.append(table_entry)
-                except Exception as e:
-                    logger.warning(f"Skipped invalid table entry: {e}")
-                    continue
-            
-            logger.info(f"Loaded {len(table_entries)} decompression table entries")
-            return table_entries
+            logger.info(f"Loaded {len(raw_data)} decompression table entries from {os.path.basename(table_path)}")
+            return raw_data
             
         except Exception as e:
             logger.error(f"Failed to load decompression table: {e}")
             raise Exception(f"Could not load decompression table: {e}")
     
+    def load_revisions(self, directory: str, registry: Optional[TableRegistry] = None) -> int:
+        """
+        Register every JSON table revision found in a directory. Unreadable or
+        invalid files are logged and skipped so they cannot take the default
+        table down with them. Returns the number of revisions registered.
+        """
+        registry = registry if registry is not None else self.registry
+        registered = 0
+        for file_name in sorted(os.listdir(directory)):
+            if not file_name.endswith('.json'):
+                continue
+            try:
+                raw_data = self._load_decompression_table(os.path.join(directory, file_name))
+                if isinstance(raw_data, dict):
+                    registry.register(raw_data.get('name') or file_name[:-5], raw_data.get('rows', []))
+                elif isinstance(raw_data, list):
+                    registry.register(file_name[:-5], raw_data)
+                else:
+                    raise Exception("se esperaba una lista de filas o un objeto con 'rows'")
+                registered += 1
+            except Exception as e:
+                logger.error(f"Skipped table revision {file_name}: {e}")
+        return registered
+
+    def warmup(self) -> int:
+        """
+        Run representative calculations (shortest, middle and longest time at
+        every depth, every mode) through each revision so the first real
+        requests hit warm code paths. Returns the number of cells exercised.
+        """
+        cells = 0
+        self._warming.active = True
+        try:
+            for revision in self.registry.list_revisions():
+                for depth in revision.depths:
+                    times = revision.times_by_depth[depth]
+                    for time in sorted({times[0], times[len(times) // 2], times[-1]}):
+                        self.calculate_decompression(depth, time, 0, 'Air', 'No', include_hints=True,
+                                                     table_revision=revision.name)
+                        for mode in DECOMPRESSION_MODES:
+                            try:
+                                self.build_schedule(depth, time, mode, revision.name)
+                            except Exception:
+                                pass  # not every cell has a schedule for every mode
+                        cells += 1
+        finally:
+            self._warming.active = False
+        logger.info(f"Warmed up {cells} table cells")
+        return cells
+
+    def _round_up(self, target: float, sorted_values: List[float]) -> float:
+        """Equal or next greater of pre-sorted values, else the largest (bisect form of the fuzz oracle)"""
+        if not sorted_values:
+            return target
+        position = bisect_left(sorted_values, target)
+        return sorted_values[position] if position < len(sorted_values) else sorted_values[-1]
+
+    def get_table_grid(self, table_revision: Optional[str] = None) -> TableGrid:
+        """Every cell of a revision with its stops, group and available modes"""
+        revision = self.registry.get(table_revision)
+        cells = [
+            TableGridCell(
+                **cell.summary.model_dump(),
+                chamberPeriods=cell.entry.periodos_camara,
+                modes=[mode for mode in DECOMPRESSION_MODES if mode in cell.modes]
+            )
+            for _, cell in sorted(revision.cells.items())
+        ]
+        return TableGrid(tableUsed=revision.name, contentHash=revision.content_hash,
+                         depths=list(revision.depths), cells=cells)
+
+    def get_time_limit(self, max_depth: float, table_revision: Optional[str] = None) -> Tuple[float, Optional[int]]:
+        """Rounded table depth for a dive and the longest bottom time tabulated there"""
+        revision = self.registry.get(table_revision)
+        rounded_depth = self._round_up(max_depth, revision.depths)
+        times = revision.times_by_depth.get(rounded_depth)
+        return rounded_depth, (times[-1] if times else None)
+
     def get_available_depths(self) -> List[float]:
         """Get all unique depths from the table"""
         depths = list(set([entry.profundidad_m for entry in self.table_data]))
@@ -46,29 +397,6 @@ class DecompressionService:
                 if entry.profundidad_m == depth]
         return sorted(list(set(times)))
     
-    def get_max_time_for_depth(self, depth: float) -> Optional[int]:
-        """Get the maximum available time for a specific depth"""
-        times = self.get_available_times_for_depth(depth)
-        return max(times) if times else None
-    
-    def find_equal_or_next_greater(self, target: float, available_values: List[float]) -> float:
-        """Find the equal or next greater value from available values"""
-        available_values = sorted(available_values)
-        
-        for value in available_values:
-            if value >= target:
-                return value
-        
-        # If no greater value found, return the maximum available
-        return max(available_values) if available_values else target
-    
-    def find_table_entry(self, depth: float, time: int) -> Optional[TableEntry]:
-        """Find the exact table entry for given depth and time"""
-        for entry in self.table_data:
-            if entry.profundidad_m == depth and entry.tiempo_fondo_min == time:
-                return entry
-        return None
-    
     def extract_decompression_stops(self, entry: TableEntry) -> List[DecompressionStop]:
         """Extract decompression stops from a table entry"""
         stops = []
@@ -105,46 +433,71 @@ class DecompressionService:
         time_minutes = distance / 9.0
         return max(1, round(time_minutes))  # At least 1 minute
     
+    def find_cell(
+        self,
+        max_depth: float,
+        bottom_time: int,
+        table_revision: Optional[str] = None,
+        oxygen_fraction: float = AIR_OXYGEN_FRACTION
+    ) -> Tuple[TableRevision, float, int, TableCell]:
+        """Round depth (or the nitrox EAD) and time to the table and return the matching cell"""
+        revision = self.registry.get(table_revision)
+        
+        # Round depth to equal or next greater available depth
+        if oxygen_fraction == AIR_OXYGEN_FRACTION:
+            rounded_depth = self._round_up(max_depth, revision.depths)
+        else:
+            rounded_depth = revision.table_depth_for_gas(max_depth, oxygen_fraction)
+        
+        # Get available times for the rounded depth
+        available_times = revision.times_by_depth.get(rounded_depth, [])
+        max_time = available_times[-1] if available_times else None
+        
+        # Check if bottom time exceeds maximum available for this depth
+        if max_time and bottom_time > max_time:
+            raise Exception("No se puede tabular esa inmersión por demasiada exposición.")
+        
+        # Round time to equal or next greater available time
+        rounded_time = int(self._round_up(bottom_time, available_times))
+        
+        cell = revision.cells.get((rounded_depth, rounded_time))
+        if not cell:
+            raise Exception(f"No table entry found for depth {rounded_depth}m and time {rounded_time} minutes")
+        
+        return revision, rounded_depth, rounded_time, cell
+    
     def calculate_decompression(
         self, 
         max_depth: float, 
         bottom_time: int,
         altitude: float,
         breathing_gas: str,
-        oxygen_deco: str
+        oxygen_deco: str,
+        include_hints: bool = False,
+        table_revision: Optional[str] = None,
+        include_oxygen_exposure: bool = False
     ) -> DecompressionResult:
         """
         Calculate decompression requirements based on US Navy Rev 7 table
+        (or the requested table revision). Nitrox dives use the air table at
+        their equivalent air depth.
         """
         try:
-            # Step 1: Get available depths and times
-            available_depths = self.get_available_depths()
-            
-            # Step 2: Round depth to equal or next greater available depth
-            rounded_depth = self.find_equal_or_next_greater(max_depth, available_depths)
-            
-            # Step 3: Get available times for the rounded depth
-            available_times = self.get_available_times_for_depth(rounded_depth)
-            max_time = self.get_max_time_for_depth(rounded_depth)
-            
-            # Step 4: Check if bottom time exceeds maximum available for this depth
-            if max_time and bottom_time > max_time:
-                raise Exception("No se puede tabular esa inmersión por demasiada exposición.")
+            oxygen_fraction = parse_breathing_gas(breathing_gas)
+            gas_check = self.check_gas(max_depth, oxygen_fraction)
             
-            # Step 5: Round time to equal or next greater available time
-            rounded_time = int(self.find_equal_or_next_greater(bottom_time, available_times))
-            
-            # Step 6: Find the exact table entry
-            table_entry = self.find_table_entry(rounded_depth, rounded_time)
+            # Steps 1-6: Round depth and time and find the table cell
+            revision, rounded_depth, rounded_time, cell = self.find_cell(
+                max_depth, bottom_time, table_revision, oxygen_fraction
+            )
             
-            if not table_entry:
-                raise Exception(f"No table entry found for depth {rounded_depth}m and time {rounded_time} minutes")
+            table_entry = cell.entry
             
-            # Step 7: Extract decompression stops
-            decompression_stops = self.extract_decompression_stops(table_entry)
+            # Step 7: Decompression stops are precomputed per cell
+            decompression_stops = list(cell.stops)
             
             # Step 8: Determine if this is a no-decompression dive
-            no_deco_dive = len(decompression_stops) == 0
+            no_deco_dive = cell.no_deco
             
             # Step 9: Calculate time to first stop
             first_stop_depth = decompression_stops[0].depth if decompression_stops else None
@@ -156,23 +509,284 @@ class DecompressionService:
                 decompressionStops=decompression_stops,
                 actualInputs=ActualInputs(depth=max_depth, bottomTime=bottom_time),
                 roundedValues=RoundedValues(depth=rounded_depth, time=rounded_time),
-                tableUsed="US Navy Rev 7 – Tabla de Aire I",
-                tableCell=f"Profundidad: {rounded_depth}m / Tiempo: {rounded_time}min",
+                tableUsed=revision.name,
+                tableCell=self.format_table_cell(rounded_depth, rounded_time, max_depth, gas_check),
                 altitude=altitude,
                 breathingGas=breathing_gas,
                 oxygenDeco=oxygen_deco,
                 totalAscentTime=table_entry.tiempo_total_ascenso,
                 repetitiveGroup=table_entry.grupo_repeticion,
-                timeToFirstStop=time_to_first_stop  # Add this new field
+                timeToFirstStop=time_to_first_stop,  # Add this new field
+                scheduleHints=ScheduleHints(
+                    minutesRemaining=rounded_time - bottom_time,
+                    nextLongerCell=cell.next_longer,
+                    nextDeeperCell=cell.next_deeper
+                ) if include_hints else None,
+                gasCheck=gas_check,
+                oxygenExposure=self.dive_oxygen_exposure(
+                    revision, cell, max_depth, bottom_time, oxygen_fraction,
+                    'o2_agua' if oxygen_deco.strip().lower() in ('yes', 'si', 'sí') and 'o2_agua' in cell.modes else 'aire'
+                ) if include_oxygen_exposure else None
             )
             
-            logger.info(f"Calculated decompression for {max_depth}m/{bottom_time}min -> {rounded_depth}m/{rounded_time}min, No-deco: {no_deco_dive}, Stops: {len(decompression_stops)}")
+            if not getattr(self._warming, "active", False):
+                logger.info(f"Calculated decompression for {max_depth}m/{bottom_time}min -> {rounded_depth}m/{rounded_time}min, No-deco: {no_deco_dive}, Stops: {len(decompression_stops)}")
             
             return result
             
         except Exception as e:
             logger.error(f"Decompression calculation failed: {e}")
             raise Exception(f"{e}")
+    
+    def check_gas(self, max_depth: float, oxygen_fraction: float) -> Optional[GasCheck]:
+        """MOD / ppO2 checks for a nitrox dive (None for air); above 1.6 ata is refused"""
+        if oxygen_fraction == AIR_OXYGEN_FRACTION:
+            return None
+        
+        ppo2 = partial_pressure_o2(max_depth, oxygen_fraction)
+        mod = math.floor(round(max_operating_depth(oxygen_fraction) * 10, 6)) / 10
+        if ppo2 > PPO2_MAX:
+            raise Exception(
+                f"ppO₂ de {ppo2:.2f} ata a {max_depth}m supera el máximo de {PPO2_MAX} ata "
+                f"para EAN{round(oxygen_fraction * 100)} (MOD {mod}m)"
+            )
+        
+        warnings = []
+        if ppo2 > PPO2_WORKING_LIMIT:
+            warnings.append(f"Profundidad mayor que la MOD ({mod}m): ppO₂ de {ppo2:.2f} ata supera {PPO2_WORKING_LIMIT} ata")
+        
+        return GasCheck(
+            oxygenFraction=oxygen_fraction,
+            equivalentAirDepth=max(0.0, math.ceil(round(equivalent_air_depth(max_depth, oxygen_fraction) * 10, 6)) / 10),
+            maxOperatingDepth=mod,
+            ppO2=round(ppo2, 2),
+            ppO2Status="warning" if warnings else "ok",
+            warnings=warnings
+        )
+    
+    def format_table_cell(self, rounded_depth: float, rounded_time: int, max_depth: float,
+                          gas_check: Optional[GasCheck]) -> str:
+        if gas_check is None:
+            return f"Profundidad: {rounded_depth}m / Tiempo: {rounded_time}min"
+        return (f"Profundidad real: {max_depth}m / EAD: {gas_check.equivalentAirDepth}m → "
+                f"Profundidad: {rounded_depth}m / Tiempo: {rounded_time}min")
+    
+    def cell_oxygen_exposure(self, revision: TableRevision, cell: TableCell, mode: str,
+                             oxygen_fraction: float = AIR_OXYGEN_FRACTION) -> Optional[OxygenExposure]:
+        """
+        Exposure of a cell's schedule for one mode (cached on the cell), with the
+        ascents and non-oxygen stops breathed on the bottom gas; None if the mode has no row
+        """
+        key = (mode, oxygen_fraction)
+        if key not in cell.oxygen_exposure:
+            try:
+                schedule = self.build_schedule(cell.entry.profundidad_m, cell.entry.tiempo_fondo_min, mode, revision.name)
+                cell.oxygen_exposure[key] = (
+                    schedule.oxygenExposure if oxygen_fraction == AIR_OXYGEN_FRACTION
+                    else phases_exposure(schedule.phases, oxygen_fraction)
+                )
+            except Exception:
+                cell.oxygen_exposure[key] = None
+        return cell.oxygen_exposure[key]
+    
+    def precompute_oxygen_exposure(self, table_revision: Optional[str] = None) -> int:
+        """Fill the per-cell exposure of every O2 / SurDO2 (and air) row of a revision"""
+        revision = self.registry.get(table_revision)
+        count = 0
+        for cell in revision.cells.values():
+            for mode in (cell.modes or {'aire': cell.row}):
+                if self.cell_oxygen_exposure(revision, cell, mode) is not None:
+                    count += 1
+        logger.info(f"Precomputed oxygen exposure for {count} schedules of '{revision.name}'")
+        return count
+    
+    def dive_oxygen_exposure(self, revision: TableRevision, cell: TableCell, max_depth: float, bottom_time: int,
+                             oxygen_fraction: float, mode: str) -> Optional[OxygenExposure]:
+        """Bottom segment at the actual depth and gas plus the cell's precomputed schedule exposure"""
+        schedule = self.cell_oxygen_exposure(revision, cell, mode, oxygen_fraction)
+        if schedule is None:
+            return None
+        cns, otu, ppo2 = bottom_exposure([max_depth], [bottom_time], [oxygen_fraction])
+        return build_exposure(cns[0] + schedule.cnsPercent, otu[0] + schedule.otu, max(ppo2[0], schedule.maxPpO2),
+                              minutes_above_noaa_range(ppo2, [bottom_time])[0] + schedule.minutesAboveNoaaRange)
+    
+    def calculate_daily_exposure(self, dives: List[DailyExposureDive], table_revision: Optional[str] = None) -> DailyExposure:
+        """
+        CNS% / OTU of each dive and running totals over the day; bottom
+        segments are vectorized across dives, schedules come from the cell cache
+        """
+        schedule_cns, schedule_otu, schedule_ppo2, schedule_above = [], [], [], []
+        fractions = []
+        for number, dive in enumerate(dives, start=1):
+            if dive.mode not in DECOMPRESSION_MODES:
+                raise Exception(f"Modo no válido: {dive.mode}")
+            oxygen_fraction = parse_breathing_gas(dive.breathingGas)
+            self.check_gas(dive.maxDepth, oxygen_fraction)
+            revision, _, _, cell = self.find_cell(dive.maxDepth, dive.bottomTime, table_revision, oxygen_fraction)
+            exposure = self.cell_oxygen_exposure(revision, cell, dive.mode, oxygen_fraction)
+            if exposure is None:
+                raise Exception(f"Inmersión {number}: no existe programa para el modo seleccionado en esta combinación de profundidad/tiempo.")
+            schedule_cns.append(exposure.cnsPercent)
+            schedule_otu.append(exposure.otu)
+            schedule_ppo2.append(exposure.maxPpO2)
+            schedule_above.append(exposure.minutesAboveNoaaRange)
+            fractions.append(oxygen_fraction)
+        
+        bottom_minutes = np.array([dive.bottomTime for dive in dives], dtype=float)
+        bottom_cns, bottom_otu, bottom_ppo2 = bottom_exposure([dive.maxDepth for dive in dives], bottom_minutes, fractions)
+        cns = bottom_cns + np.array(schedule_cns)
+        otu = bottom_otu + np.array(schedule_otu)
+        ppo2 = np.maximum(bottom_ppo2, schedule_ppo2)
+        above = minutes_above_noaa_range(bottom_ppo2, bottom_minutes) + np.array(schedule_above)
+        running_cns, running_otu = accumulate_daily(cns, otu, [dive.surfaceInterval for dive in dives])
+        
+        return DailyExposure(
+            dives=[
+                DailyExposureDiveResult(
+                    diveNumber=index + 1,
+                    exposure=build_exposure(cns[index], otu[index], ppo2[index], above[index]),
+                    cnsPercentAfterDive=round(float(running_cns[index]), 1),
+                    otuAfterDive=round(float(running_otu[index]), 1)
+                )
+                for index in range(len(dives))
+            ],
+            cnsPercent=round(float(running_cns[-1]), 1),
+            otu=round(float(running_otu[-1]), 1),
+            warnings=exposure_warnings(float(running_cns[-1]), float(running_otu[-1]), float(above.sum()))
+        )
+    
+    def _travel_seconds(self, from_depth: float, to_depth: float, rate: float) -> int:
+        """Seconds to travel between two depths at rate m/min"""
+        return round(abs(from_depth - to_depth) / rate * 60)
+    
+    def _phase(self, phase_type: str, depth: float, seconds: float, gas: str, description: str,
+               from_depth: Optional[float] = None) -> SchedulePhase:
+        return SchedulePhase(type=phase_type, depth=depth, fromDepth=from_depth,
+                             duration=round(seconds), gas=gas, description=description)
+    
+    def _in_water_phases(self, max_depth: float, stops: List[DecompressionStop], o2_stops: bool) -> Tuple[List[SchedulePhase], float]:
+        """Ascents and stops in the water; O2 stops are split into 30 min periods with 5 min air breaks"""
+        phases = []
+        current_depth = max_depth
+        
+        for stop in stops:
+            if current_depth > stop.depth:
+                phases.append(self._phase('ascent', stop.depth, self._travel_seconds(current_depth, stop.depth, ASCENT_RATE),
+                                          'Aire', f"Ascenso de {current_depth}m a {stop.depth}m (9 m/min)", current_depth))
+            current_depth = stop.depth
+            
+            if not (o2_stops and stop.depth <= O2_STOP_MAX_DEPTH):
+                phases.append(self._phase('stop', stop.depth, stop.duration * 60, 'Aire',
+                                          f"Parada de descompresión en {stop.depth}m"))
+                continue
+            
+            remaining = stop.duration
+            period = 0
+            while remaining > 0:
+                period += 1
+                if remaining <= O2_FINAL_SEGMENT_MAX_MINUTES:
+                    phases.append(self._phase('o2_period', stop.depth, remaining * 60, 'O₂',
+                                              f"Período {period} de O₂ - {remaining:g} min"))
+                    break
+                phases.append(self._phase('o2_period', stop.depth, O2_PERIOD_MINUTES * 60, 'O₂',
+                                          f"Período {period} de O₂ - {O2_PERIOD_MINUTES} min"))
+                phases.append(self._phase('air_break', stop.depth, AIR_BREAK_MINUTES * 60, 'Aire',
+                                          f"Descanso con aire - {AIR_BREAK_MINUTES} min"))
+                remaining -= O2_PERIOD_MINUTES
+        
+        return phases, current_depth
+    
+    def _chamber_phases(self, chamber_periods: float) -> List[SchedulePhase]:
+        """SurDO2 chamber O2 periods: 15 m then 12.2 m, moving to 9 m after the fourth period"""
+        phases = []
+        chamber_depth = CHAMBER_DEPTH
+        remaining = chamber_periods
+        period = 0
+        
+        while remaining > 0:
+            period += 1
+            if period == 1:
+                travel = (CHAMBER_DEPTH - SURDO2_LAST_WATER_STOP) / CHAMBER_RATE * 60
+                phases.append(self._phase('chamber_o2_period', CHAMBER_DEPTH, 15 * 60, 'O₂',
+                                          "Período 1 de O₂ - 15 min en 15m"))
+                phases.append(self._phase('ascent', SURDO2_LAST_WATER_STOP, travel, 'O₂',
+                                          "Ascenso 15m → 12.2m durante Período 1 (30 m/min)", CHAMBER_DEPTH))
+                phases.append(self._phase('chamber_o2_period', SURDO2_LAST_WATER_STOP, 15 * 60 - travel, 'O₂',
+                                          "Período 1 de O₂ - resto en 12.2m"))
+                chamber_depth = SURDO2_LAST_WATER_STOP
+                remaining -= 1
+            else:
+                fraction = min(remaining, 1)
+                phases.append(self._phase('chamber_o2_period', chamber_depth, fraction * O2_PERIOD_MINUTES * 60, 'O₂',
+                                          f"Período {period} de O₂ - {fraction * O2_PERIOD_MINUTES:g} min en {chamber_depth}m"))
+                remaining -= fraction
+            
+            if remaining > 0:
+                phases.append(self._phase('air_break', chamber_depth, AIR_BREAK_MINUTES * 60, 'Aire',
+                                          f"Descanso con aire - {AIR_BREAK_MINUTES} min"))
+                if period == 4:
+                    phases.append(self._phase('ascent', 9.0, self._travel_seconds(chamber_depth, 9.0, CHAMBER_RATE), 'Aire',
+                                              "Ascenso 12.2m → 9m durante descanso (30 m/min)", chamber_depth))
+                    chamber_depth = 9.0
+        
+        phases.append(self._phase('ascent', 0, self._travel_seconds(chamber_depth, 0, CHAMBER_RATE), 'Aire',
+                                  "Ascenso final a superficie en cámara (30 m/min)", chamber_depth))
+        return phases
+    
+    def build_schedule(
+        self,
+        max_depth: float,
+        bottom_time: int,
+        mode: str = 'aire',
+        table_revision: Optional[str] = None
+    ) -> DiveSchedule:
+        """
+        Expand the table row for a decompression mode into timed phases:
+        ascents, stops, in-water O2 periods and SurDO2 chamber periods
+        """
+        if mode not in DECOMPRESSION_MODES:
+            raise Exception(f"Modo no válido: {mode}")
+        
+        revision, rounded_depth, rounded_time, cell = self.find_cell(max_depth, bottom_time, table_revision)
+        row = cell.row if cell.no_deco else cell.modes.get(mode)
+        if row is None:
+            raise Exception("No existe programa para el modo seleccionado en esta combinación de profundidad/tiempo.")
+        
+        # SurDO2 rows may have no water stops and still require chamber periods
+        no_deco = row.no_deco and not row.entry.periodos_camara
+        if no_deco:
+            phases = [self._phase('ascent', 0, self._travel_seconds(max_depth, 0, ASCENT_RATE), 'Aire',
+                                  "Ascenso directo a superficie a 9 m/min", max_depth)]
+        elif mode == 'surdo2':
+            water_stops = [stop for stop in row.stops if stop.depth >= SURDO2_LAST_WATER_STOP]
+            phases, current_depth = self._in_water_phases(max_depth, water_stops, o2_stops=False)
+            if current_depth > SURDO2_LAST_WATER_STOP:
+                phases.append(self._phase('ascent', SURDO2_LAST_WATER_STOP,
+                                          self._travel_seconds(current_depth, SURDO2_LAST_WATER_STOP, ASCENT_RATE),
+                                          'Aire', f"Ascenso de {current_depth}m a 12.2m (9 m/min)", current_depth))
+                current_depth = SURDO2_LAST_WATER_STOP
+            transfer = (self._travel_seconds(current_depth, 0, SURDO2_SURFACE_ASCENT_RATE)
+                        + self._travel_seconds(0, CHAMBER_DEPTH, CHAMBER_RATE))
+            phases.append(self._phase('surface_transfer', CHAMBER_DEPTH, transfer, 'Aire',
+                                      f"Transición SurDO₂: {current_depth}m → Superficie → Cámara 15m", current_depth))
+            phases.extend(self._chamber_phases(row.entry.periodos_camara or 0))
+        else:
+            phases, current_depth = self._in_water_phases(max_depth, row.stops, o2_stops=mode == 'o2_agua')
+            phases.append(self._phase('ascent', 0, self._travel_seconds(current_depth, 0, ASCENT_RATE), 'Aire',
+                                      f"Ascenso final a superficie de {current_depth}m (9 m/min)", current_depth))
+        
+        return DiveSchedule(
+            mode=mode,
+            roundedValues=RoundedValues(depth=rounded_depth, time=rounded_time),
+            noDecompressionDive=no_deco,
+            decompressionStops=list(row.stops),
+            chamberPeriods=row.entry.periodos_camara,
+            repetitiveGroup=row.entry.grupo_repeticion,
+            tableUsed=revision.name,
+            phases=phases,
+            totalDuration=sum(phase.duration for phase in phases),
+            oxygenExposure=phases_exposure(phases)
+        )
 
 # Global service instance
 decompression_service = DecompressionService()
\ No newline at end of file
@@ -0,0 +1,374 @@
+import math
+import re
+import warnings
+import xml.etree.ElementTree as ET
+from typing import AsyncIterator, Iterable, Iterator, List, Optional
+import numpy as np
+from models import DiveLogDive
+from decompression_service import decompression_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# A dive starts once the diver is deeper than this (meters)
+DIVE_START_DEPTH = 1.2
+# Surface intervals shorter than this are merged into the same dive (seconds),
+# matching the <10 min rule applied to repetitive dives
+SURFACE_MERGE_SECONDS = 10 * 60
+# Samples this close to the maximum depth are still on the bottom (meters),
+# wide enough for flat bottoms logged with sensor noise or 0.1 m quantization
+BOTTOM_DEPTH_TOLERANCE = 1.0
+# Rising slower than this (m/min, a third of the 9 m/min ascent rate) over
+# LEVEL_SECONDS is a level, not the final ascent
+MIN_ASCENT_RATE = 3.0
+LEVEL_SECONDS = 60
+# Levels at or above this depth (meters) are safety stops, part of the ascent
+SAFETY_STOP_DEPTH = 6.0
+
+TIME_COLUMN_NAMES = ("time", "tiempo", "divetime", "seconds", "t")
+DEPTH_COLUMN_NAMES = ("depth", "profundidad", "depth_m", "d")
+
+
+class DiveLogReducer:
+    """
+    Reduce a time/depth sample stream into one summary per dive.
+
+    Samples are fed in arbitrary-sized numpy batches. Only the samples of the
+    dive currently in progress are retained, so memory is bounded by the
+    longest single dive rather than by the whole log.
+    """
+
+    def __init__(
+        self,
+        start_depth: float = DIVE_START_DEPTH,
+        surface_merge_seconds: float = SURFACE_MERGE_SECONDS,
+        bottom_tolerance: float = BOTTOM_DEPTH_TOLERANCE,
+        min_ascent_rate: float = MIN_ASCENT_RATE
+    ):
+        self.start_depth = start_depth
+        self.surface_merge_seconds = surface_merge_seconds
+        self.bottom_tolerance = bottom_tolerance
+        self.min_ascent_rate = min_ascent_rate
+        self._open_times: List[np.ndarray] = []
+        self._open_depths: List[np.ndarray] = []
+        self._last_time: Optional[float] = None
+
+    def feed(self, times: np.ndarray, depths: np.ndarray) -> List[dict]:
+        """Add a batch of samples; return the dives that are now known to be finished"""
+        times = np.asarray(times, dtype=float)
+        depths = np.asarray(depths, dtype=float)
+
+        underwater = depths > self.start_depth
+        under_times = times[underwater]
+        under_depths = depths[underwater]
+        if under_times.size == 0:
+            return []
+
+        previous = self._last_time if self._last_time is not None else -np.inf
+        gaps = np.diff(under_times, prepend=previous)
+        breaks = np.flatnonzero(gaps > self.surface_merge_seconds)
+
+        finished = []
+        start = 0
+        for index in breaks:
+            if index > start:
+                self._open_times.append(under_times[start:index])
+                self._open_depths.append(under_depths[start:index])
+            dive = self._close()
+            if dive:
+                finished.append(dive)
+            start = index
+
+        self._open_times.append(under_times[start:])
+        self._open_depths.append(under_depths[start:])
+        self._last_time = float(under_times[-1])
+        return finished
+
+    def finish(self) -> List[dict]:
+        """Close the dive in progress at the end of the log"""
+        dive = self._close()
+        self._last_time = None
+        return [dive] if dive else []
+
+    def _close(self) -> Optional[dict]:
+        if not self._open_times:
+            return None
+
+        times = np.concatenate(self._open_times)
+        depths = np.concatenate(self._open_depths)
+        self._open_times = []
+        self._open_depths = []
+        return self.summarize(times, depths)
+
+    def summarize(self, times: np.ndarray, depths: np.ndarray) -> dict:
+        """
+        Extract max depth and bottom time from one dive's samples.
+
+        Bottom time runs from leaving the surface to the start of the final
+        ascent: the later of the last sample within the bottom tolerance of the
+        maximum depth and the end of the last level below the safety stop
+        depth, so later shallower levels of a multi-level dive count as bottom
+        time too. A level is any minute in which the diver rose slower than
+        the minimum ascent rate.
+        """
+        max_depth = float(depths.max())
+        leave_index = int(np.flatnonzero(depths >= max_depth - self.bottom_tolerance)[-1])
+
+        # Depth LEVEL_SECONDS before each sample (clamped to the first sample)
+        earlier_depths = np.interp(times - LEVEL_SECONDS, times, depths)
+        rise = earlier_depths - depths
+        lingering = np.flatnonzero(
+            (rise < self.min_ascent_rate * LEVEL_SECONDS / 60.0)
+            & (depths > SAFETY_STOP_DEPTH + self.bottom_tolerance)
+        )
+        lingering = lingering[lingering > leave_index]
+        if lingering.size:
+            # The window of the last lingering sample still overlaps the level; its end is
+            # the last sample of that window within the bottom tolerance of the level depth
+            last = int(lingering[-1])
+            window = np.flatnonzero(times[:last + 1] >= times[last] - LEVEL_SECONDS)
+            level = window[depths[window] >= depths[window].max() - self.bottom_tolerance]
+            leave_index = max(leave_index, int(level[-1]))
+
+        bottom_seconds = times[leave_index] - times[0]
+        return {
+            "startTime": float(times[0]),
+            "endTime": float(times[-1]),
+            "maxDepth": round(max_depth, 1),
+            "bottomTime": max(1, math.ceil(bottom_seconds / 60.0)),
+            "sampleCount": int(times.size),
+        }
+
+
+class CsvSampleParser:
+    """Incremental parser for ``time,depth[,...]`` CSV logs (time in seconds)"""
+
+    def __init__(self):
+        self._pending = b""
+        self._columns: Optional[int] = None
+        self._time_column = 0
+        self._depth_column = 1
+
+    def feed(self, chunk: bytes):
+        data = self._pending + chunk
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            self._pending = data
+            return None
+        self._pending = data[cut + 1:]
+        return self._parse_block(data[:cut + 1])
+
+    def close(self):
+        data, self._pending = self._pending, b""
+        return self._parse_block(data) if data.strip() else None
+
+    def _parse_block(self, block: bytes):
+        text = block.decode("utf-8-sig").replace("\r", "")
+        text = re.sub(r"\n{2,}", "\n", text).strip("\n")
+        if not text:
+            return None
+
+        if self._columns is None:
+            first_line, _, text = text.partition("\n")
+            header = [value.strip().lower() for value in first_line.split(",")]
+            self._columns = len(header)
+            if self._is_header(header):
+                self._time_column = self._find_column(header, TIME_COLUMN_NAMES, 0)
+                self._depth_column = self._find_column(header, DEPTH_COLUMN_NAMES, 1)
+            else:
+                text = first_line + ("\n" + text if text else "")
+            if not text:
+                return None
+
+        # Every line must have exactly columns - 1 commas; flattening below would
+        # otherwise silently re-pair ragged lines whose value counts balance out
+        raw = np.frombuffer(text.encode("utf-8"), dtype=np.uint8)
+        commas_before = np.concatenate(([0], np.cumsum(raw == ord(","))))
+        line_ends = np.append(np.flatnonzero(raw == ord("\n")), raw.size)
+        commas_per_line = np.diff(commas_before[line_ends], prepend=0)
+        if np.any(commas_per_line != self._columns - 1):
+            raise Exception(f"Registro CSV mal formado: se esperaban {self._columns} columnas por línea")
+
+        with warnings.catch_warnings():
+            warnings.simplefilter("error", DeprecationWarning)
+            try:
+                values = np.fromstring(text.replace("\n", ","), dtype=float, sep=",")
+            except (ValueError, DeprecationWarning):
+                raise Exception("Registro CSV mal formado: se esperaban valores numéricos")
+
+        if values.size % self._columns:
+            raise Exception(f"Registro CSV mal formado: se esperaban {self._columns} columnas por línea")
+
+        samples = values.reshape(-1, self._columns)
+        return samples[:, self._time_column], samples[:, self._depth_column]
+
+    def _is_header(self, values: List[str]) -> bool:
+        try:
+            [float(value) for value in values]
+            return False
+        except ValueError:
+            return True
+
+    def _find_column(self, header: List[str], names: Iterable[str], default: int) -> int:
+        for index, column in enumerate(header):
+            if column in names or any(column.startswith(name + "_") for name in names):
+                return index
+        return default
+
+
+class XmlSampleParser:
+    """
+    Incremental parser for a simple UDDF-like layout:
+    ``<dive><samples><waypoint><divetime/><depth/></waypoint>...</samples></dive>``.
+    Each ``<dive>`` element is treated as a dive boundary.
+    """
+
+    def __init__(self):
+        self._parser = ET.XMLPullParser(events=("end",))
+        self._times: List[float] = []
+        self._depths: List[float] = []
+        self._waypoint = {}
+
+    def feed(self, chunk: bytes):
+        try:
+            self._parser.feed(chunk)
+        except ET.ParseError as e:
+            raise Exception(f"Registro XML mal formado: {e}")
+        return self._drain()
+
+    def close(self):
+        try:
+            self._parser.close()
+        except ET.ParseError as e:
+            raise Exception(f"Registro XML mal formado: {e}")
+        return self._drain()
+
+    def _drain(self):
+        batches = []
+        for _, element in self._parser.read_events():
+            tag = element.tag.rsplit("}", 1)[-1]
+            if tag in ("divetime", "depth"):
+                self._waypoint[tag] = element.text
+            elif tag == "waypoint":
+                if "divetime" in self._waypoint and "depth" in self._waypoint:
+                    self._times.append(float(self._waypoint["divetime"]))
+                    self._depths.append(float(self._waypoint["depth"]))
+                self._waypoint = {}
+                element.clear()
+            elif tag == "dive":
+                batches.append(self._flush())
+                batches.append(None)  # dive boundary
+                element.clear()
+        batches.append(self._flush())
+        return batches
+
+    def _flush(self):
+        if not self._times:
+            return ()
+        batch = (np.array(self._times), np.array(self._depths))
+        self._times = []
+        self._depths = []
+        return batch
+
+
+class DiveLogService:
+    def __init__(self, service=decompression_service):
+        self.service = service
+
+    def create_parser(self, log_format: str):
+        if log_format == "xml":
+            return XmlSampleParser()
+        if log_format == "csv":
+            return CsvSampleParser()
+        raise Exception(f"Formato de registro no soportado: {log_format}")
+
+    def _reduce_batches(self, reducer: DiveLogReducer, parsed) -> List[dict]:
+        """Feed parser output (CSV: one batch, XML: list of batches/boundaries) to the reducer"""
+        if parsed is None:
+            return []
+        if isinstance(parsed, tuple):
+            return reducer.feed(*parsed)
+
+        dives = []
+        for batch in parsed:
+            if batch is None:
+                dives.extend(reducer.finish())
+            elif batch:
+                dives.extend(reducer.feed(*batch))
+        return dives
+
+    def build_dive(
+        self,
+        dive_number: int,
+        dive: dict,
+        altitude: float,
+        breathing_gas: str,
+        oxygen_deco: str,
+        table_revision: Optional[str] = None
+    ) -> DiveLogDive:
+        """Run the reduced dive through the table"""
+        try:
+            result = self.service.calculate_decompression(
+                max_depth=dive["maxDepth"],
+                bottom_time=dive["bottomTime"],
+                altitude=altitude,
+                breathing_gas=breathing_gas,
+                oxygen_deco=oxygen_deco,
+                table_revision=table_revision
+            )
+            return DiveLogDive(diveNumber=dive_number, result=result, **dive)
+        except Exception as e:
+            return DiveLogDive(diveNumber=dive_number, error=str(e), **dive)
+
+    def reduce_dive_log(
+        self,
+        chunks: Iterable[bytes],
+        log_format: str = "csv",
+        altitude: float = 0,
+        breathing_gas: str = "Air",
+        oxygen_deco: str = "No",
+        table_revision: Optional[str] = None
+    ) -> Iterator[DiveLogDive]:
+        """Parse a dive-computer log stream and yield each dive with its schedule"""
+        parser = self.create_parser(log_format)
+        reducer = DiveLogReducer()
+        dive_number = 0
+
+        for chunk in chunks:
+            for dive in self._reduce_batches(reducer, parser.feed(chunk)):
+                dive_number += 1
+                yield self.build_dive(dive_number, dive, altitude, breathing_gas, oxygen_deco, table_revision)
+
+        dives = self._reduce_batches(reducer, parser.close()) + reducer.finish()
+        for dive in dives:
+            dive_number += 1
+            yield self.build_dive(dive_number, dive, altitude, breathing_gas, oxygen_deco, table_revision)
+
+    async def reduce_dive_log_stream(
+        self,
+        chunks: AsyncIterator[bytes],
+        log_format: str = "csv",
+        altitude: float = 0,
+        breathing_gas: str = "Air",
+        oxygen_deco: str = "No",
+        table_revision: Optional[str] = None
+    ) -> List[DiveLogDive]:
+        """Async counterpart of reduce_dive_log for request bodies"""
+        parser = self.create_parser(log_format)
+        reducer = DiveLogReducer()
+        reduced = []
+
+        async for chunk in chunks:
+            reduced.extend(self._reduce_batches(reducer, parser.feed(chunk)))
+        reduced.extend(self._reduce_batches(reducer, parser.close()))
+        reduced.extend(reducer.finish())
+
+        logger.info(f"Reduced dive log into {len(reduced)} dives")
+        return [
+            self.build_dive(number, dive, altitude, breathing_gas, oxygen_deco, table_revision)
+            for number, dive in enumerate(reduced, start=1)
+        ]
+
+
+# Global service instance
+dive_log_service = DiveLogService()
@@ -0,0 +1,220 @@
+import asyncio
+import heapq
+import itertools
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set
+from models import DiveSchedule, DiveSessionInfo, DiveSessionRequest
+from decompression_service import decompression_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+# How long finished sessions stay queryable before they are dropped (seconds)
+SESSION_RETENTION_SECONDS = 60 * 60
+# Events buffered per subscriber before the oldest ones are dropped
+SUBSCRIBER_QUEUE_SIZE = 1000
+
+PHASE_DUE = "phase"
+EXPIRE_DUE = "expire"
+# After one of these a session publishes nothing more
+FINAL_EVENTS = ("session_completed", "session_cancelled")
+
+
+class DiveSession:
+    """A running dive: its schedule and where it is on the shared clock"""
+
+    def __init__(self, session_id: str, diver_name: str, schedule: DiveSchedule, started_at: float):
+        self.id = session_id
+        self.diver_name = diver_name
+        self.schedule = schedule
+        self.state = "running"
+        self.started_at = started_at
+        self.started_at_wall = datetime.utcnow()
+        self.phase_index = 0
+        # Absolute offsets (s) at which each phase ends, so timers never accumulate drift
+        self.phase_ends = list(itertools.accumulate(phase.duration for phase in schedule.phases))
+
+    def phase_end_time(self, index: int) -> float:
+        return self.started_at + self.phase_ends[index]
+
+    def _wall(self, offset: float) -> datetime:
+        return self.started_at_wall + timedelta(seconds=offset)
+
+    def to_info(self) -> DiveSessionInfo:
+        running = self.state == "running"
+        return DiveSessionInfo(
+            id=self.id,
+            diverName=self.diver_name,
+            state=self.state,
+            startedAt=self.started_at_wall,
+            endsAt=self._wall(self.phase_ends[-1] if self.phase_ends else 0),
+            currentPhaseIndex=self.phase_index if running else None,
+            currentPhase=self.schedule.phases[self.phase_index] if running else None,
+            phaseEndsAt=self._wall(self.phase_ends[self.phase_index]) if running else None,
+            schedule=self.schedule
+        )
+
+
+class DiveSessionService:
+    """
+    Drives every session's phase timers from one asyncio task.
+
+    Each session has exactly one pending deadline in a heap (its current
+    phase's end), so thousands of sessions cost one sleeping task and
+    O(log n) per phase change instead of one task per timer. Step events are
+    fanned out to subscriber queues consumed by the WebSocket / SSE endpoints.
+    """
+
+    def __init__(self, service=decompression_service, clock=time.monotonic):
+        self.service = service
+        self.clock = clock
+        self.sessions: Dict[str, DiveSession] = {}
+        self._heap: List[tuple] = []
+        self._sequence = itertools.count()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._subscribers: Dict[Optional[str], Set[asyncio.Queue]] = {}
+
+    def _ensure_running(self):
+        if self._task is None or self._task.done():
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def _schedule(self, due: float, session_id: str, kind: str):
+        item = (due, next(self._sequence), session_id, kind)
+        heapq.heappush(self._heap, item)
+        if self._heap[0] is item and self._wakeup is not None:
+            self._wakeup.set()
+
+    def start_session(self, request: DiveSessionRequest) -> DiveSession:
+        """Compute the schedule and start its first phase now"""
+        schedule = self.service.build_schedule(
+            max_depth=request.maxDepth,
+            bottom_time=request.bottomTime,
+            mode=request.mode,
+            table_revision=request.tableRevision
+        )
+        self._ensure_running()
+
+        session = DiveSession(str(uuid.uuid4()), request.diverName, schedule, self.clock())
+        self.sessions[session.id] = session
+        self._schedule(session.phase_end_time(0), session.id, PHASE_DUE)
+
+        logger.info(f"Started dive session {session.id} for {request.diverName}: {len(schedule.phases)} phases")
+        self._publish(session, "session_started")
+        self._publish(session, "phase_started")
+        return session
+
+    def cancel_session(self, session_id: str) -> DiveSession:
+        session = self.get_session(session_id)
+        if session.state == "running":
+            session.state = "cancelled"
+            self._schedule(self.clock() + SESSION_RETENTION_SECONDS, session.id, EXPIRE_DUE)
+            self._publish(session, "session_cancelled")
+        return session
+
+    def get_session(self, session_id: str) -> DiveSession:
+        session = self.sessions.get(session_id)
+        if session is None:
+            raise KeyError(f"Sesión de buceo no encontrada: {session_id}")
+        return session
+
+    def list_sessions(self) -> List[DiveSession]:
+        return list(self.sessions.values())
+
+    def is_live(self, session_id: Optional[str] = None) -> bool:
+        """Whether a feed for session_id (None: every session) can still receive events"""
+        if session_id is None:
+            return True
+        session = self.sessions.get(session_id)
+        return session is not None and session.state == "running"
+
+    def subscribe(self, session_id: Optional[str] = None) -> asyncio.Queue:
+        """Queue of events for one session, or for every session when session_id is None"""
+        queue = asyncio.Queue(maxsize=SUBSCRIBER_QUEUE_SIZE)
+        self._subscribers.setdefault(session_id, set()).add(queue)
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue, session_id: Optional[str] = None):
+        subscribers = self._subscribers.get(session_id)
+        if subscribers is not None:
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[session_id]
+
+    def _publish(self, session: DiveSession, event_type: str):
+        info = session.to_info()
+        event = {
+            "event": event_type,
+            "sessionId": session.id,
+            "diverName": session.diver_name,
+            "state": session.state,
+            "phaseIndex": info.currentPhaseIndex,
+            "phase": info.currentPhase.model_dump() if info.currentPhase else None,
+            "phaseEndsAt": info.phaseEndsAt.isoformat() if info.phaseEndsAt else None,
+            "timestamp": datetime.utcnow().isoformat(),
+        }
+        for key in (session.id, None):
+            for queue in self._subscribers.get(key, ()):
+                if queue.full():
+                    queue.get_nowait()
+                queue.put_nowait(event)
+
+    def _advance(self, session_id: str, kind: str):
+        session = self.sessions.get(session_id)
+        if session is None:
+            return
+        if kind == EXPIRE_DUE:
+            del self.sessions[session_id]
+            return
+        if session.state != "running":
+            return
+
+        session.phase_index += 1
+        if session.phase_index < len(session.schedule.phases):
+            self._schedule(session.phase_end_time(session.phase_index), session.id, PHASE_DUE)
+            self._publish(session, "phase_started")
+        else:
+            session.state = "completed"
+            self._schedule(self.clock() + SESSION_RETENTION_SECONDS, session.id, EXPIRE_DUE)
+            self._publish(session, "session_completed")
+
+    async def _run(self):
+        """Single scheduler loop: sleep until the earliest deadline, fire everything due"""
+        while True:
+            self._wakeup.clear()
+            if not self._heap:
+                await self._wakeup.wait()
+                continue
+
+            delay = self._heap[0][0] - self.clock()
+            if delay > 0:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            now = self.clock()
+            while self._heap and self._heap[0][0] <= now:
+                _, _, session_id, kind = heapq.heappop(self._heap)
+                try:
+                    self._advance(session_id, kind)
+                except Exception as e:
+                    logger.error(f"Dive session {session_id} step failed: {e}")
+
+    async def stop(self):
+        """Stop the scheduler task (on shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+# Global service instance
+dive_session_service = DiveSessionService()
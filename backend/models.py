@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Optional
+from typing import Dict, List, Optional
 from datetime import datetime
 
 class DecompressionRequest(BaseModel):
@@ -8,6 +8,9 @@ class DecompressionRequest(BaseModel):
     altitude: float = Field(..., ge=0, description="Altitude above sea level in meters")
     breathingGas: str = Field(..., description="Breathing gas type")
     oxygenDeco: str = Field(..., description="Oxygen decompression option")
+    includeScheduleHints: bool = Field(False, description="Include next-cell hints in the result")
+    includeOxygenExposure: bool = Field(False, description="Include CNS% / OTU for the dive in the result")
+    tableRevision: Optional[str] = Field(None, description="Table revision name or content hash (default: Rev 7)")
 
 class DecompressionStop(BaseModel):
     depth: float = Field(..., description="Stop depth in meters")
@@ -21,6 +24,43 @@ class RoundedValues(BaseModel):
     depth: float
     time: int
 
+class CellSummary(BaseModel):
+    depth: float
+    time: int
+    noDecompressionDive: bool
+    decompressionStops: List[DecompressionStop]
+    totalAscentTime: str
+    repetitiveGroup: str
+
+class TableGridCell(CellSummary):
+    chamberPeriods: Optional[float] = None
+    modes: List[str] = Field([], description="Decompression modes with a schedule for this cell")
+
+class TableGrid(BaseModel):
+    tableUsed: str
+    contentHash: str
+    depths: List[float]
+    cells: List[TableGridCell] = Field(..., description="Every depth/time cell, by depth then time")
+
+class ScheduleHints(BaseModel):
+    minutesRemaining: int = Field(..., description="Minutes of bottom time left before the schedule changes")
+    nextLongerCell: Optional[CellSummary] = None
+    nextDeeperCell: Optional[CellSummary] = None
+
+class GasCheck(BaseModel):
+    oxygenFraction: float
+    equivalentAirDepth: float = Field(..., description="Depth used to enter the air table in meters")
+    maxOperatingDepth: float = Field(..., description="Depth at which ppO2 reaches 1.4 ata")
+    ppO2: float = Field(..., description="ppO2 at the maximum depth in ata")
+    ppO2Status: str = Field(..., description="ok or warning (above 1.4 ata)")
+    warnings: List[str] = []
+
+class OxygenExposure(BaseModel):
+    cnsPercent: float = Field(..., description="CNS oxygen clock in % of the NOAA limits")
+    otu: float = Field(..., description="Oxygen tolerance units (pulmonary dose)")
+    maxPpO2: float = Field(..., description="Highest ppO2 in ata")
+    minutesAboveNoaaRange: float = Field(0, description="Minutes above 1.6 ata, charged at the 1.6 ata limit: cnsPercent is then a lower bound")
+
 class DecompressionResult(BaseModel):
     noDecompressionDive: bool
     decompressionStops: List[DecompressionStop]
@@ -34,9 +74,180 @@ class DecompressionResult(BaseModel):
     totalAscentTime: str
     repetitiveGroup: str
     timeToFirstStop: Optional[int] = 0  # New field for time to first stop
+    scheduleHints: Optional[ScheduleHints] = None
+    gasCheck: Optional[GasCheck] = None
+    oxygenExposure: Optional[OxygenExposure] = None
+
+class DiveLogDive(BaseModel):
+    diveNumber: int
+    startTime: float = Field(..., description="Log time (s) of the first sample below the start depth")
+    endTime: float = Field(..., description="Log time (s) of the last sample below the start depth")
+    maxDepth: float = Field(..., description="Deepest sample in meters")
+    bottomTime: int = Field(..., description="Minutes from leaving the surface to leaving the bottom, rounded up")
+    sampleCount: int
+    result: Optional[DecompressionResult] = None
+    error: Optional[str] = None
+
+class SurfaceIntervalRequest(BaseModel):
+    repetitiveGroup: str = Field(..., description="Repetitive group at the start of the surface interval")
+    maxDepth: float = Field(..., gt=0, description="Planned depth of the next dive in meters")
+    bottomTime: int = Field(..., gt=0, description="Planned bottom time of the next dive in minutes")
+    targetScheduleTime: Optional[int] = Field(None, gt=0, description="Table bottom time the dive must fit into")
+
+class SurfaceIntervalSolution(BaseModel):
+    repetitiveGroup: str
+    maxDepth: float
+    bottomTime: Optional[int] = None
+    permitted: bool
+    minSurfaceInterval: Optional[int] = Field(None, description="Shortest surface interval in minutes")
+    minSurfaceIntervalFormatted: Optional[str] = None
+    groupAfterInterval: Optional[str] = None
+    residualNitrogenTime: Optional[int] = None
+    equivalentBottomTime: Optional[int] = None
+
+class PlanningCard(BaseModel):
+    bottomTime: Optional[int] = None
+    targetScheduleTime: Optional[int] = None
+    depths: List[float]
+    groups: List[str]
+    minSurfaceIntervals: Dict[str, List[Optional[int]]] = Field(..., description="Minutes per group, one entry per depth")
+
+class SchedulePhase(BaseModel):
+    type: str = Field(..., description="ascent, stop, o2_period, air_break, surface_transfer or chamber_o2_period")
+    depth: float = Field(..., description="Depth at the end of the phase in meters")
+    fromDepth: Optional[float] = None
+    duration: int = Field(..., description="Phase duration in seconds")
+    gas: str
+    description: str
+
+class DiveSchedule(BaseModel):
+    mode: str
+    roundedValues: RoundedValues
+    noDecompressionDive: bool
+    decompressionStops: List[DecompressionStop]
+    chamberPeriods: Optional[float] = None
+    repetitiveGroup: str
+    tableUsed: str
+    phases: List[SchedulePhase]
+    totalDuration: int = Field(..., description="Sum of all phase durations in seconds")
+    oxygenExposure: Optional[OxygenExposure] = Field(None, description="Exposure of the phases (bottom time excluded)")
+
+class DailyExposureDive(BaseModel):
+    maxDepth: float = Field(..., gt=0, description="Maximum depth in meters")
+    bottomTime: int = Field(..., gt=0, description="Bottom time in minutes")
+    mode: str = Field("aire", description="aire, o2_agua or surdo2")
+    breathingGas: str = Field("Aire", description="Bottom gas: Aire or a nitrox mix")
+    surfaceInterval: int = Field(0, ge=0, description="Minutes at the surface before this dive")
+
+class DailyExposureRequest(BaseModel):
+    dives: List[DailyExposureDive] = Field(..., min_length=1)
+    tableRevision: Optional[str] = None
+
+class DailyExposureDiveResult(BaseModel):
+    diveNumber: int
+    exposure: OxygenExposure
+    cnsPercentAfterDive: float = Field(..., description="Running CNS% including decay over surface intervals")
+    otuAfterDive: float
+
+class DailyExposure(BaseModel):
+    dives: List[DailyExposureDiveResult]
+    cnsPercent: float
+    otu: float
+    warnings: List[str] = []
+
+class DiveSessionRequest(BaseModel):
+    diverName: str = Field(..., min_length=1)
+    maxDepth: float = Field(..., gt=0, description="Maximum depth in meters")
+    bottomTime: int = Field(..., gt=0, description="Bottom time in minutes")
+    mode: str = Field("aire", description="aire, o2_agua or surdo2")
+    tableRevision: Optional[str] = None
+
+class DiveSessionInfo(BaseModel):
+    id: str
+    diverName: str
+    state: str = Field(..., description="running, completed or cancelled")
+    startedAt: datetime
+    endsAt: datetime
+    currentPhaseIndex: Optional[int] = None
+    currentPhase: Optional[SchedulePhase] = None
+    phaseEndsAt: Optional[datetime] = None
+    schedule: DiveSchedule
+
+class TableRevisionInfo(BaseModel):
+    name: str
+    contentHash: str
+    shortHash: str
+    entries: int
+    isDefault: bool
+
+class HotCell(BaseModel):
+    tableUsed: str
+    depth: float
+    time: int
+    count: int
+
+class HotCellHistogram(BaseModel):
+    windowDays: int
+    unflushedRequests: int = Field(..., description="Requests counted by this worker but not yet written")
+    cells: List[HotCell]
+
+class DivePlanDiveInput(BaseModel):
+    maxDepth: float = Field(..., gt=0, description="Maximum depth in meters")
+    bottomTime: int = Field(..., gt=0, description="Bottom time in minutes")
+    surfaceInterval: Optional[int] = Field(None, ge=0, description="Minutes at the surface before this dive (ignored for the first dive)")
+    mode: str = Field("aire", description="aire, o2_agua or surdo2")
+
+class DivePlanDive(BaseModel):
+    diveNumber: int
+    input: DivePlanDiveInput
+    groupIn: Optional[str] = Field(None, description="Repetitive group at the start of the dive")
+    residualNitrogenTime: Optional[int] = None
+    equivalentBottomTime: Optional[int] = Field(None, description="Bottom time used for the table (with RNT or merged dives)")
+    effectiveDepth: Optional[float] = Field(None, description="Depth used for the table (deepest of merged dives)")
+    groupOut: Optional[str] = Field(None, description="Repetitive group at the end of the dive")
+    roundedValues: Optional[RoundedValues] = None
+    noDecompressionDive: Optional[bool] = None
+    decompressionStops: List[DecompressionStop] = []
+    totalDuration: Optional[int] = Field(None, description="Ascent schedule duration in seconds")
+    error: Optional[str] = None
+
+class DivePlanRequest(BaseModel):
+    name: str = Field(..., min_length=1)
+    dives: List[DivePlanDiveInput] = Field(..., min_length=1)
+    tableRevision: Optional[str] = None
+
+class DivePlan(BaseModel):
+    id: str
+    name: str
+    tableRevision: Optional[str] = None
+    version: int
+    createdAt: datetime
+    updatedAt: datetime
+    dives: List[DivePlanDive]
+
+class DivePlanUpdate(BaseModel):
+    plan: DivePlan
+    recomputedFrom: int = Field(..., description="First dive number recomputed")
+    recomputedDives: int = Field(..., description="Dives recomputed before the carried state matched again")
+
+class ShareRequest(BaseModel):
+    calculation: Optional[DecompressionRequest] = Field(None, description="A single calculation to share")
+    plan: Optional[DivePlanRequest] = Field(None, description="A multi-dive plan to share")
+
+class ShareLink(BaseModel):
+    id: str = Field(..., description="Short ID used to retrieve the shared result")
+    contentHash: str = Field(..., description="SHA-256 of the canonical inputs and table version")
+    kind: str = Field(..., description="calculation or plan")
+    tableUsed: str
+    tableHash: str
+    created: bool = Field(..., description="False when an identical result was already stored")
 
 class TableEntry(BaseModel):
     profundidad_m: float = Field(..., alias="Profundidad (m)")
+    descompresion_aire: Optional[str] = Field(None, alias="Descompresion con aire")
+    descompresion_o2_agua: Optional[str] = Field(None, alias="Descompresion con O2 en el agua ")
+    descompresion_superficie: Optional[str] = Field(None, alias="Descompresion en superficie")
+    periodos_camara: Optional[float] = Field(None, alias="Periodos en camara")
     tiempo_fondo_min: int = Field(..., alias="Tiempo de Fondo (min)")
     tiempo_primera_parada: Optional[str] = Field(None, alias="Tiempo hasta la primera parada")
     parada_39_6m: Optional[float] = Field(None, alias="Parada 39.6m")
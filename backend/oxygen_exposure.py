@@ -0,0 +1,104 @@
+from typing import List, Sequence, Tuple
+import numpy as np
+from models import OxygenExposure, SchedulePhase
+
+# NOAA single-exposure limits: ppO2 (ata) -> minutes
+NOAA_PPO2 = np.array([0.6, 0.7, 0.8, 0.9, 1.0, 1.1, 1.2, 1.3, 1.4, 1.5, 1.6])
+NOAA_LIMIT_MINUTES = np.array([720, 570, 450, 360, 300, 240, 210, 180, 150, 120, 45], dtype=float)
+# The NOAA limits stop here; time above it is charged at the 1.6 ata limit and
+# reported separately, since the CNS% is then only a lower bound
+NOAA_MAX_PPO2 = 1.6
+# The limits are tabulated in 0.1 ata steps: ppO2 that rounds to 1.6 (e.g. O2 at 6.1 m) is in range
+NOAA_PPO2_RESOLUTION = 0.1
+# No CNS or pulmonary loading at or below this ppO2 (ata)
+OXYGEN_THRESHOLD_PPO2 = 0.5
+OTU_EXPONENT = 5 / 6
+CNS_HALF_LIFE_MINUTES = 90.0
+CNS_LIMIT_PERCENT = 100.0
+DAILY_OTU_LIMIT = 850.0
+METERS_PER_ATMOSPHERE = 10.0
+
+AIR_OXYGEN_FRACTION = 0.21
+OXYGEN_GAS = 'O₂'
+
+
+def phase_arrays(phases: Sequence[SchedulePhase], bottom_gas_fraction: float = AIR_OXYGEN_FRACTION) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    ppO2 (ata, at the phase's mean depth) and duration (min) of every phase.
+    Phases not on oxygen ("Aire" in the schedule) are breathed on the bottom gas.
+    """
+    depths = np.array([phase.depth for phase in phases], dtype=float)
+    from_depths = np.array([phase.depth if phase.fromDepth is None else phase.fromDepth for phase in phases], dtype=float)
+    fractions = np.array([1.0 if phase.gas == OXYGEN_GAS else bottom_gas_fraction for phase in phases])
+    minutes = np.array([phase.duration for phase in phases], dtype=float) / 60.0
+    ppo2 = ((depths + from_depths) / 2 / METERS_PER_ATMOSPHERE + 1) * fractions
+    return ppo2, minutes
+
+
+def segment_exposure(ppo2: np.ndarray, minutes: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    CNS% and OTU of each segment. CNS uses the NOAA limits (interpolated);
+    the table ends at 1.6 ata, so higher ppO2 is charged at the 1.6 limit and
+    must be flagged with minutes_above_noaa_range. OTU = t * ((ppO2 - 0.5) / 0.5) ^ 0.83
+    """
+    ppo2 = np.asarray(ppo2, dtype=float)
+    minutes = np.asarray(minutes, dtype=float)
+    loaded = ppo2 > OXYGEN_THRESHOLD_PPO2
+    limits = np.interp(ppo2, NOAA_PPO2, NOAA_LIMIT_MINUTES)
+    cns = np.where(loaded, minutes / limits * 100.0, 0.0)
+    otu = np.where(loaded, minutes * np.clip((ppo2 - OXYGEN_THRESHOLD_PPO2) / OXYGEN_THRESHOLD_PPO2, 0, None) ** OTU_EXPONENT, 0.0)
+    return cns, otu
+
+
+def minutes_above_noaa_range(ppo2: np.ndarray, minutes: np.ndarray) -> np.ndarray:
+    """Minutes of each segment breathed above 1.6 ata, where the CNS% is only a lower bound"""
+    outside = np.asarray(ppo2, dtype=float) >= NOAA_MAX_PPO2 + NOAA_PPO2_RESOLUTION / 2
+    return np.where(outside, np.asarray(minutes, dtype=float), 0.0)
+
+
+def build_exposure(cns: float, otu: float, max_ppo2: float, minutes_above: float = 0.0) -> OxygenExposure:
+    return OxygenExposure(cnsPercent=round(float(cns), 1), otu=round(float(otu), 1), maxPpO2=round(float(max_ppo2), 2),
+                          minutesAboveNoaaRange=round(float(minutes_above), 1))
+
+
+def phases_exposure(phases: Sequence[SchedulePhase], bottom_gas_fraction: float = AIR_OXYGEN_FRACTION) -> OxygenExposure:
+    """Total exposure of a schedule timeline"""
+    if not phases:
+        return build_exposure(0, 0, 0)
+    ppo2, minutes = phase_arrays(phases, bottom_gas_fraction)
+    cns, otu = segment_exposure(ppo2, minutes)
+    return build_exposure(cns.sum(), otu.sum(), ppo2.max(), minutes_above_noaa_range(ppo2, minutes).sum())
+
+
+def bottom_exposure(depths: np.ndarray, minutes: np.ndarray, oxygen_fractions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """CNS%, OTU and ppO2 of bottom segments, one per dive"""
+    ppo2 = (np.asarray(depths, dtype=float) / METERS_PER_ATMOSPHERE + 1) * np.asarray(oxygen_fractions, dtype=float)
+    cns, otu = segment_exposure(ppo2, minutes)
+    return cns, otu, ppo2
+
+
+def accumulate_daily(cns: np.ndarray, otu: np.ndarray, surface_intervals: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Running CNS% and OTU after each dive of a day. CNS decays with a 90 min
+    half-life over each surface interval; OTU simply adds up.
+
+    cns_i = sum_j c_j * 2^-(t_i - t_j)/90, computed as one cumulative sum with
+    t the elapsed surface time before dive i.
+    """
+    elapsed = np.cumsum(np.asarray(surface_intervals, dtype=float))
+    # Relative to the last dive so the exponents stay <= 0; beyond 2^-1000 a dive is long washed out
+    relative = np.maximum((elapsed - elapsed[-1]) / CNS_HALF_LIFE_MINUTES, -1000.0)
+    running_cns = np.cumsum(np.asarray(cns, dtype=float) * np.exp2(relative)) / np.exp2(relative)
+    return running_cns, np.cumsum(otu)
+
+
+def exposure_warnings(cns_percent: float, otu: float, minutes_above: float = 0.0) -> List[str]:
+    warnings = []
+    if minutes_above > 0:
+        warnings.append(f"{minutes_above:.0f} min por encima de {NOAA_MAX_PPO2} ata, fuera de los límites NOAA: "
+                        f"la exposición CNS es un mínimo")
+    if cns_percent > CNS_LIMIT_PERCENT:
+        warnings.append(f"Exposición CNS de {cns_percent:.0f}% supera el {CNS_LIMIT_PERCENT:.0f}%")
+    if otu > DAILY_OTU_LIMIT:
+        warnings.append(f"Dosis pulmonar de {otu:.0f} OTU supera el límite diario de {DAILY_OTU_LIMIT:.0f} OTU")
+    return warnings
@@ -0,0 +1,178 @@
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from models import DivePlan, DivePlanDive, DivePlanDiveInput, DivePlanRequest, DivePlanUpdate
+from decompression_service import decompression_service
+from repetitive_service import repetitive_service, MIN_SURFACE_INTERVAL, NOT_PERMITTED
+from database import get_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+PLANS_COLLECTION = "dive_plans"
+
+
+class DivePlanService:
+    """
+    Stored multi-dive day plans.
+
+    Every dive keeps the state the next dive depends on (group in/out,
+    equivalent bottom time, effective depth), so an edit recomputes from the
+    edited dive forward and stops as soon as a dive's carried-forward state is
+    the same as before the edit; later dives are then known to be unchanged.
+    """
+
+    def __init__(self, service=decompression_service, repetitive=repetitive_service):
+        self.service = service
+        self.repetitive = repetitive
+
+    def _carried_state(self, dive: Optional[DivePlanDive]) -> Tuple:
+        """Everything the following dive reads from this one"""
+        if dive is None:
+            return ()
+        return (dive.groupIn, dive.groupOut, dive.equivalentBottomTime, dive.effectiveDepth, dive.error is None)
+
+    def compute_dive(
+        self,
+        dive_number: int,
+        dive_input: DivePlanDiveInput,
+        previous: Optional[DivePlanDive],
+        table_revision: Optional[str] = None
+    ) -> DivePlanDive:
+        """One dive of the chain from its inputs and the previous dive's state"""
+        dive = DivePlanDive(diveNumber=dive_number, input=dive_input)
+
+        if previous is not None and previous.error is not None:
+            dive.error = f"La inmersión {previous.diveNumber} no tiene programa válido."
+            return dive
+
+        if previous is None:
+            dive.equivalentBottomTime = dive_input.bottomTime
+            dive.effectiveDepth = dive_input.maxDepth
+        elif (dive_input.surfaceInterval or 0) < MIN_SURFACE_INTERVAL:
+            # <10 min rule: merge with the previous dive
+            dive.groupIn = previous.groupIn
+            dive.equivalentBottomTime = previous.equivalentBottomTime + dive_input.bottomTime
+            dive.effectiveDepth = max(previous.effectiveDepth, dive_input.maxDepth)
+        else:
+            dive.groupIn, rnt = self.repetitive.get_repetitive_rnt(
+                previous.groupOut, dive_input.surfaceInterval, dive_input.maxDepth
+            )
+            if rnt == NOT_PERMITTED:
+                dive.error = "No está permitido realizar buceos sucesivos con este buzo (siguiendo las reglas del US Navy Rev 7)."
+                return dive
+            if rnt is None:
+                dive.error = "No se pudo determinar el tiempo de nitrógeno residual para esta profundidad."
+                return dive
+            dive.residualNitrogenTime = rnt
+            dive.equivalentBottomTime = dive_input.bottomTime + rnt
+            dive.effectiveDepth = dive_input.maxDepth
+
+        try:
+            schedule = self.service.build_schedule(
+                max_depth=dive.effectiveDepth,
+                bottom_time=dive.equivalentBottomTime,
+                mode=dive_input.mode,
+                table_revision=table_revision
+            )
+        except Exception as e:
+            dive.error = str(e)
+            return dive
+
+        dive.groupOut = schedule.repetitiveGroup
+        dive.roundedValues = schedule.roundedValues
+        dive.noDecompressionDive = schedule.noDecompressionDive
+        dive.decompressionStops = schedule.decompressionStops
+        dive.totalDuration = schedule.totalDuration
+        return dive
+
+    def recompute(
+        self,
+        dives: List[DivePlanDive],
+        start: int,
+        table_revision: Optional[str] = None
+    ) -> Tuple[List[DivePlanDive], int]:
+        """
+        Recompute dives[start:] in place, stopping once a recomputed dive carries
+        the same state forward as its stored version. Returns the dives and how
+        many were recomputed.
+        """
+        recomputed = 0
+        for index in range(start, len(dives)):
+            previous = dives[index - 1] if index > 0 else None
+            old = dives[index]
+            new = self.compute_dive(index + 1, old.input, previous, table_revision)
+            dives[index] = new
+            recomputed += 1
+            # The next dive's inputs are unchanged, so it would come out the same
+            if self._carried_state(new) == self._carried_state(old):
+                break
+        return dives, recomputed
+
+    def build_plan(self, request: DivePlanRequest) -> DivePlan:
+        dives: List[DivePlanDive] = []
+        for number, dive_input in enumerate(request.dives, start=1):
+            dives.append(self.compute_dive(number, dive_input, dives[-1] if dives else None, request.tableRevision))
+
+        now = datetime.utcnow()
+        return DivePlan(
+            id=str(uuid.uuid4()),
+            name=request.name,
+            tableRevision=request.tableRevision,
+            version=1,
+            createdAt=now,
+            updatedAt=now,
+            dives=dives
+        )
+
+    async def create_plan(self, request: DivePlanRequest) -> DivePlan:
+        plan = self.build_plan(request)
+        document = plan.model_dump()
+        document["_id"] = document.pop("id")
+        await get_db()[PLANS_COLLECTION].insert_one(document)
+        logger.info(f"Created dive plan {plan.id} with {len(plan.dives)} dives")
+        return plan
+
+    async def get_plan(self, plan_id: str) -> DivePlan:
+        document = await get_db()[PLANS_COLLECTION].find_one({"_id": plan_id})
+        if document is None:
+            raise KeyError(f"Plan de buceo no encontrado: {plan_id}")
+        document["id"] = document.pop("_id")
+        return DivePlan(**document)
+
+    async def update_dive(self, plan_id: str, dive_number: int, dive_input: DivePlanDiveInput) -> DivePlanUpdate:
+        """
+        Replace one dive's inputs, recompute forward until the chain settles and
+        write back only the dives that changed, guarded by the plan version
+        """
+        plan = await self.get_plan(plan_id)
+        if not 1 <= dive_number <= len(plan.dives):
+            raise KeyError(f"Inmersión {dive_number} no existe en el plan {plan_id}")
+
+        start = dive_number - 1
+        old_dives = list(plan.dives)
+        plan.dives[start] = plan.dives[start].model_copy(update={"input": dive_input})
+        dives, recomputed = self.recompute(plan.dives, start, plan.tableRevision)
+
+        changes = {
+            f"dives.{index}": dives[index].model_dump()
+            for index in range(start, start + recomputed)
+            if dives[index] != old_dives[index]
+        }
+        plan.updatedAt = datetime.utcnow()
+        changes["updatedAt"] = plan.updatedAt
+
+        result = await get_db()[PLANS_COLLECTION].update_one(
+            {"_id": plan_id, "version": plan.version},
+            {"$set": changes, "$inc": {"version": 1}}
+        )
+        if result.matched_count == 0:
+            raise Exception("El plan fue modificado por otra solicitud; vuelva a cargarlo.")
+        plan.version += 1
+
+        logger.info(f"Updated dive {dive_number} of plan {plan_id}: recomputed {recomputed} dives")
+        return DivePlanUpdate(plan=plan, recomputedFrom=dive_number, recomputedDives=recomputed)
+
+
+# Global service instance
+dive_plan_service = DivePlanService()
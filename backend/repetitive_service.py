@@ -0,0 +1,238 @@
+import json
+import math
+import os
+import re
+import threading
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple, Union
+from models import SurfaceIntervalSolution, PlanningCard
+from decompression_service import decompression_service
+import logging
+
+logger = logging.getLogger(__name__)
+
+TABLES_DIR = os.path.join(os.path.dirname(__file__), '..', 'tables')
+
+# Surface intervals shorter than this are not repetitive dives (the dives are merged)
+MIN_SURFACE_INTERVAL = 10
+NOT_PERMITTED = '**'
+# US Navy note: read vertically down to the next deeper depth and use its RNT
+READ_DOWN = '†'
+# Bottom-time budget used when only permission (not a schedule) is asked for
+UNBOUNDED_MINUTES = 10 ** 6
+
+
+def parse_interval_range(range_string: str) -> Optional[Tuple[int, int]]:
+    """Parse a tabla_2_1 range such as "0:10TO2:20" into minutes"""
+    match = re.match(r'(\d+):(\d+)TO(\d+):(\d+)', range_string or '')
+    if not match:
+        return None
+    start_hours, start_minutes, end_hours, end_minutes = (int(value) for value in match.groups())
+    return start_hours * 60 + start_minutes, end_hours * 60 + end_minutes
+
+
+def format_interval(minutes: int) -> str:
+    """Format minutes as H:MM, the notation used by tabla_2_1"""
+    return f"{minutes // 60}:{minutes % 60:02d}"
+
+
+class RepetitiveDiveService:
+    def __init__(self, service=decompression_service):
+        self.service = service
+        self._loaded = False
+        self._load_lock = threading.Lock()
+
+    def load(self):
+        """Load and index tabla_2_1 / tabla_2_2 on first use; idempotent"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.surface_interval_table = self._load_table('tabla_2_1.json')
+                self.rnt_table = self._load_table('tabla_2_2.json')
+                self._build_index()
+                self._loaded = True
+
+    def _load_table(self, file_name: str) -> List[dict]:
+        """Load one of the repetitive dive tables from JSON"""
+        table_path = os.path.join(TABLES_DIR, file_name)
+
+        try:
+            with open(table_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception as e:
+            logger.error(f"Failed to load {file_name}: {e}")
+            raise Exception(f"Could not load {file_name}: {e}")
+
+    def _build_index(self):
+        """
+        Index tabla_2_1 interval boundaries per group and tabla_2_2 RNT per depth,
+        then precompute, for every group x depth pair, the RNT reached at each
+        interval boundary so the solver is a single bisect.
+        """
+        intervals: Dict[str, List[Tuple[int, int, str]]] = {}
+        for entry in self.surface_interval_table:
+            parsed = parse_interval_range(entry['Intervalo en superficie'])
+            if not parsed:
+                continue
+            start_group = entry['Grupo de buceo sucesivo al principio del intervalo']
+            end_group = entry['Grupo de buceo sucesivo al final del intervalo en superficie']
+            intervals.setdefault(start_group, []).append((parsed[0], parsed[1], end_group))
+        for group_intervals in intervals.values():
+            group_intervals.sort()
+            # Open-ended row past the last listed interval, shared by the solver and
+            # get_new_repetitive_group: a diver who has reached group A is clean
+            # (None, RNT 0); a group whose listed intervals stop earlier keeps its last group
+            last_end, last_group = group_intervals[-1][1], group_intervals[-1][2]
+            group_intervals.append((last_end + 1, math.inf, None if last_group == 'A' else last_group))
+
+        rnt_rows = [dict(row) for row in sorted(self.rnt_table, key=lambda row: row['Profundidad del buceo sucesivo'])]
+        for index in range(len(rnt_rows) - 2, -1, -1):
+            for group, value in rnt_rows[index].items():
+                if value == READ_DOWN:
+                    rnt_rows[index][group] = rnt_rows[index + 1].get(group)
+        self._rnt_depths = [row['Profundidad del buceo sucesivo'] for row in rnt_rows]
+        self._rnt_rows = rnt_rows
+        self._interval_starts = {group: [start for start, _, _ in rows] for group, rows in intervals.items()}
+        self._intervals = intervals
+
+        # (group, depth) -> (interval starts, end groups, RNT per interval, running minimum of RNT negated)
+        schedules = {}
+        for group, group_intervals in intervals.items():
+            boundaries = [(start, end_group) for start, _, end_group in group_intervals]
+
+            for row in rnt_rows:
+                starts, end_groups, rnts, running_min = [], [], [], []
+                lowest = math.inf
+                for start, end_group in boundaries:
+                    value = 0 if end_group is None else row.get(end_group)
+                    rnt = math.inf if value in (None, NOT_PERMITTED) else int(value)
+                    lowest = min(lowest, rnt)
+                    starts.append(start)
+                    end_groups.append(end_group)
+                    rnts.append(rnt)
+                    running_min.append(-lowest)
+                schedules[(group, row['Profundidad del buceo sucesivo'])] = (starts, end_groups, rnts, running_min)
+        self._schedules = schedules
+
+        logger.info(f"Indexed {len(intervals)} repetitive groups x {len(rnt_rows)} RNT depths")
+
+    def get_rnt_depth(self, depth: float) -> Optional[float]:
+        """Exact or next greater tabla_2_2 depth"""
+        self.load()
+        position = bisect_left(self._rnt_depths, depth)
+        return self._rnt_depths[position] if position < len(self._rnt_depths) else None
+
+    def get_new_repetitive_group(self, previous_group: str, surface_interval: int) -> Optional[str]:
+        """
+        Repetitive group at the end of a surface interval (tabla_2_1); None once
+        the interval is past the table and the diver is clean
+        """
+        self.load()
+        rows = self._intervals.get(previous_group)
+        if not rows:
+            return previous_group
+        position = bisect_right(self._interval_starts[previous_group], surface_interval) - 1
+        if position >= 0 and surface_interval <= rows[position][1]:
+            return rows[position][2]
+        return previous_group
+
+    def get_repetitive_rnt(
+        self,
+        previous_group: str,
+        surface_interval: int,
+        depth: float
+    ) -> Tuple[Optional[str], Union[int, str, None]]:
+        """Group after a surface interval and the RNT it carries into a dive to depth"""
+        group = self.get_new_repetitive_group(previous_group, surface_interval)
+        if group is None and previous_group in self._intervals:
+            return None, 0
+        return group, self.get_rnt(group, depth)
+
+    def get_rnt(self, repetitive_group: str, depth: float) -> Union[int, str, None]:
+        """Residual nitrogen time for a group at the next dive's depth (tabla_2_2)"""
+        self.load()
+        position = bisect_left(self._rnt_depths, depth)
+        if position >= len(self._rnt_rows):
+            return None
+        value = self._rnt_rows[position].get(repetitive_group)
+        if value == NOT_PERMITTED:
+            return NOT_PERMITTED
+        return int(value) if value is not None else None
+
+    def find_min_surface_interval(
+        self,
+        repetitive_group: str,
+        max_depth: float,
+        bottom_time: Optional[int] = None,
+        target_schedule_time: Optional[int] = None
+    ) -> SurfaceIntervalSolution:
+        """
+        Shortest surface interval after which a dive to max_depth is permitted,
+        i.e. the RNT is not "**" and bottom time + RNT still fits the air table
+        (or target_schedule_time, when given)
+        """
+        self.load()
+        solution = SurfaceIntervalSolution(
+            repetitiveGroup=repetitive_group,
+            maxDepth=max_depth,
+            bottomTime=bottom_time,
+            permitted=False
+        )
+
+        rnt_depth = self.get_rnt_depth(max_depth)
+        schedule = self._schedules.get((repetitive_group, rnt_depth))
+        if schedule is None:
+            return solution
+
+        if bottom_time is None:
+            allowed = UNBOUNDED_MINUTES
+        else:
+            _, time_limit = self.service.get_time_limit(max_depth)
+            if target_schedule_time is not None:
+                time_limit = min(time_limit, target_schedule_time) if time_limit else target_schedule_time
+            if time_limit is None or bottom_time > time_limit:
+                return solution
+            allowed = time_limit - bottom_time
+
+        starts, end_groups, rnts, running_min = schedule
+        position = bisect_left(running_min, -allowed)
+        if position >= len(starts) or rnts[position] == math.inf:
+            return solution
+
+        surface_interval = max(starts[position], MIN_SURFACE_INTERVAL)
+        rnt = rnts[position]
+        solution.permitted = True
+        solution.minSurfaceInterval = surface_interval
+        solution.minSurfaceIntervalFormatted = format_interval(surface_interval)
+        solution.groupAfterInterval = end_groups[position]
+        solution.residualNitrogenTime = rnt
+        solution.equivalentBottomTime = bottom_time + rnt if bottom_time is not None else None
+        return solution
+
+    def get_planning_card(
+        self,
+        bottom_time: Optional[int] = None,
+        target_schedule_time: Optional[int] = None
+    ) -> PlanningCard:
+        """Minimum surface interval for every group x tabla_2_2 depth pair"""
+        self.load()
+        groups = sorted(self._intervals)
+        card = {}
+        for group in groups:
+            card[group] = [
+                self.find_min_surface_interval(group, depth, bottom_time, target_schedule_time).minSurfaceInterval
+                for depth in self._rnt_depths
+            ]
+
+        return PlanningCard(
+            bottomTime=bottom_time,
+            targetScheduleTime=target_schedule_time,
+            depths=list(self._rnt_depths),
+            groups=groups,
+            minSurfaceIntervals=card
+        )
+
+
+# Global service instance
+repetitive_service = RepetitiveDiveService()
@@ -1,29 +1,72 @@
-from fastapi import FastAPI, APIRouter, HTTPException
+from fastapi import FastAPI, APIRouter, HTTPException, Query, Request, WebSocket, WebSocketDisconnect
+from fastapi.responses import JSONResponse, Response, StreamingResponse
 from dotenv import load_dotenv
 from starlette.middleware.cors import CORSMiddleware
-from motor.motor_asyncio import AsyncIOMotorClient
-import os
+from contextlib import asynccontextmanager
+import asyncio
+import json
 import logging
 from pathlib import Path
 from pydantic import BaseModel, Field
-from typing import List
+from typing import List, Optional
 import uuid
 from datetime import datetime
 
+# Before the local imports: services read their settings at import time
+ROOT_DIR = Path(__file__).parent
+load_dotenv(ROOT_DIR / '.env')
+
 # Import our decompression models and service
-from models import DecompressionRequest, DecompressionResult
+from models import (
+    DecompressionRequest, DecompressionResult, DiveLogDive,
+    SurfaceIntervalRequest, SurfaceIntervalSolution, PlanningCard, TableRevisionInfo,
+    DiveSessionRequest, DiveSessionInfo, HotCellHistogram, DailyExposureRequest, DailyExposure,
+    DivePlanRequest, DivePlan, DivePlanDiveInput, DivePlanUpdate, ShareRequest, ShareLink, TableGrid
+)
 from decompression_service import decompression_service
+from bulk_service import bulk_service, detect_format, RequestBodyStreamingResponse
+from dive_log_service import dive_log_service
+from repetitive_service import repetitive_service
+from dive_session_service import dive_session_service, FINAL_EVENTS
+from usage_service import usage_service, MAX_HISTOGRAM_CELLS, PREWARM_TOP_CELLS, USAGE_WINDOW_DAYS
+from compression_service import payload_service
+from plan_service import dive_plan_service
+from share_service import share_service
+from database import get_db, close_client
 
-ROOT_DIR = Path(__file__).parent
-load_dotenv(ROOT_DIR / '.env')
+# Set once the tables are loaded and the calculation paths are warm
+app_state = {"ready": False, "warmup_error": None}
+
+async def warm_up():
+    """Load the tables and run representative calculations off the event loop"""
+    try:
+        await asyncio.to_thread(decompression_service.load)
+        await asyncio.to_thread(repetitive_service.load)
+        await asyncio.to_thread(decompression_service.warmup)
+        await asyncio.to_thread(decompression_service.precompute_oxygen_exposure)
+        await asyncio.to_thread(payload_service.get, table_payload_key("table-info"), build_table_info)
+        await asyncio.to_thread(payload_service.get, table_payload_key("table-grid"), decompression_service.get_table_grid)
+        await asyncio.to_thread(payload_service.get, table_payload_key("planning-card", None, None),
+                                repetitive_service.get_planning_card)
+        await usage_service.prewarm()
+        app_state["ready"] = True
+        logging.info("Warmup finished, worker is ready")
+    except Exception as e:
+        app_state["warmup_error"] = str(e)
+        logging.error(f"Warmup failed: {e}")
 
-# MongoDB connection
-mongo_url = os.environ['MONGO_URL']
-client = AsyncIOMotorClient(mongo_url)
-db = client[os.environ['DB_NAME']]
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    warmup_task = asyncio.create_task(warm_up())
+    usage_service.start()
+    yield
+    warmup_task.cancel()
+    await dive_session_service.stop()
+    await usage_service.stop()
+    close_client()
 
 # Create the main app without a prefix
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 # Create a router with the /api prefix
 api_router = APIRouter(prefix="/api")
@@ -46,12 +89,12 @@ async def root():
 async def create_status_check(input: StatusCheckCreate):
     status_dict = input.dict()
     status_obj = StatusCheck(**status_dict)
-    _ = await db.status_checks.insert_one(status_obj.dict())
+    _ = await get_db().status_checks.insert_one(status_obj.dict())
     return status_obj
 
 @api_router.get("/status", response_model=List[StatusCheck])
 async def get_status_checks():
-    status_checks = await db.status_checks.find().to_list(1000)
+    status_checks = await get_db().status_checks.find().to_list(1000)
     return [StatusCheck(**status_check) for status_check in status_checks]
 
 # New decompression endpoints
@@ -61,49 +104,347 @@ async def calculate_decompression(request: DecompressionRequest):
     Calculate decompression stops based on dive parameters using US Navy Rev 7 table
     """
     try:
-        result = decompression_service.calculate_decompression(
+        # Pre-serialized body from the response cache (counts the cell either way)
+        body = usage_service.calculate(request)
+        return Response(content=body, media_type="application/json")
+    except Exception as e:
+        logging.error(f"Decompression calculation error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/decompression/hot-cells", response_model=HotCellHistogram)
+async def get_hot_cells(
+    limit: int = Query(PREWARM_TOP_CELLS, ge=1, le=MAX_HISTOGRAM_CELLS),
+    days: int = Query(USAGE_WINDOW_DAYS, ge=1, le=USAGE_WINDOW_DAYS)
+):
+    """
+    Most requested table cells over the rolling window, for capacity planning
+    (older daily buckets have already expired, so days is capped at the window)
+    """
+    try:
+        return await usage_service.get_histogram(limit, days)
+    except Exception as e:
+        logging.error(f"Hot cells error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@api_router.post("/decompression/bulk")
+async def calculate_decompression_bulk(request: Request, format: str = None):
+    """
+    Calculate a CSV or NDJSON upload of dive profiles, streaming one result per row
+    """
+    input_format = detect_format(request.headers.get("content-type"))
+    output_format = format or detect_format(request.headers.get("accept"), default=input_format)
+    if output_format not in ("csv", "ndjson"):
+        raise HTTPException(status_code=400, detail="Formato de salida no soportado (csv o ndjson)")
+
+    media_type = "text/csv" if output_format == "csv" else "application/x-ndjson"
+    return RequestBodyStreamingResponse(
+        bulk_service.stream_results(request.stream(), input_format, output_format),
+        media_type=media_type
+    )
+
+@api_router.post("/dive-logs/analyze", response_model=List[DiveLogDive])
+async def analyze_dive_log(
+    request: Request,
+    altitude: float = 0,
+    breathingGas: str = "Air",
+    oxygenDeco: str = "No",
+    tableRevision: Optional[str] = None
+):
+    """
+    Split a dive-computer log (CSV time/depth samples or UDDF-like XML) into dives
+    and compute the table schedule for each one
+    """
+    content_type = (request.headers.get("content-type") or "").lower()
+    log_format = "xml" if "xml" in content_type else "csv"
+    try:
+        return await dive_log_service.reduce_dive_log_stream(
+            request.stream(),
+            log_format=log_format,
+            altitude=altitude,
+            breathing_gas=breathingGas,
+            oxygen_deco=oxygenDeco,
+            table_revision=tableRevision
+        )
+    except Exception as e:
+        logging.error(f"Dive log analysis error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/repetitive/surface-interval", response_model=SurfaceIntervalSolution)
+async def find_min_surface_interval(request: SurfaceIntervalRequest):
+    """
+    Shortest surface interval that permits the planned repetitive dive
+    """
+    try:
+        return repetitive_service.find_min_surface_interval(
+            repetitive_group=request.repetitiveGroup.upper(),
             max_depth=request.maxDepth,
             bottom_time=request.bottomTime,
-            altitude=request.altitude,
-            breathing_gas=request.breathingGas,
-            oxygen_deco=request.oxygenDeco
+            target_schedule_time=request.targetScheduleTime
         )
-        return result
     except Exception as e:
-        logging.error(f"Decompression calculation error: {e}")
+        logging.error(f"Surface interval solver error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/repetitive/planning-card", response_model=PlanningCard)
+async def get_planning_card(request: Request, bottomTime: Optional[int] = None, targetScheduleTime: Optional[int] = None):
+    """
+    Minimum surface interval for every repetitive group and depth, for printing
+    """
+    try:
+        key = table_payload_key("planning-card", bottomTime, targetScheduleTime)
+        return payload_service.response(
+            request, key, lambda: repetitive_service.get_planning_card(bottomTime, targetScheduleTime)
+        )
+    except Exception as e:
+        logging.error(f"Planning card error: {e}")
         raise HTTPException(status_code=400, detail=str(e))
 
+@api_router.get("/decompression/tables", response_model=List[TableRevisionInfo])
+async def list_table_revisions():
+    """
+    List the loaded table revisions
+    """
+    registry = decompression_service.registry
+    return [
+        TableRevisionInfo(
+            name=revision.name,
+            contentHash=revision.content_hash,
+            shortHash=revision.short_hash,
+            entries=len(revision.rows),
+            isDefault=revision.name == registry.default_name
+        )
+        for revision in registry.list_revisions()
+    ]
+
+def table_payload_key(name: str, *params) -> tuple:
+    """Precompressed payloads are keyed by the default table's content hash"""
+    return (name, decompression_service.registry.get().content_hash, *params)
+
+def build_table_info() -> dict:
+    available_depths = decompression_service.get_available_depths()
+    
+    # Get sample times for the first few depths
+    sample_info = {}
+    for depth in available_depths[:5]:  # First 5 depths as examples
+        times = decompression_service.get_available_times_for_depth(depth)
+        sample_info[f"{depth}m"] = {
+            "times": times[:5],  # First 5 times
+            "total_entries": len(times)
+        }
+    
+    return {
+        "table_name": decompression_service.registry.get().name,
+        "total_depths": len(available_depths),
+        "depth_range": {
+            "min": min(available_depths),
+            "max": max(available_depths)
+        },
+        "available_depths": available_depths,
+        "sample_depth_times": sample_info
+    }
+
 @api_router.get("/decompression/table-info")
-async def get_table_info():
+async def get_table_info(request: Request):
     """
     Get information about available depths and times in the decompression table
+    (built once per table version; too small to be worth compressing, the full
+    grid is /decompression/table)
     """
     try:
-        available_depths = decompression_service.get_available_depths()
-        
-        # Get sample times for the first few depths
-        sample_info = {}
-        for depth in available_depths[:5]:  # First 5 depths as examples
-            times = decompression_service.get_available_times_for_depth(depth)
-            sample_info[f"{depth}m"] = {
-                "times": times[:5],  # First 5 times
-                "total_entries": len(times)
-            }
-        
-        return {
-            "table_name": "US Navy Rev 7 – Tabla de Aire I",
-            "total_depths": len(available_depths),
-            "depth_range": {
-                "min": min(available_depths),
-                "max": max(available_depths)
-            },
-            "available_depths": available_depths,
-            "sample_depth_times": sample_info
-        }
+        return payload_service.response(request, table_payload_key("table-info"), build_table_info)
     except Exception as e:
         logging.error(f"Table info error: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@api_router.get("/decompression/table", response_model=TableGrid)
+async def get_table_grid(request: Request, tableRevision: Optional[str] = None):
+    """
+    Every cell of a table revision, for offline use on the tablets
+    (built and compressed once per table version)
+    """
+    try:
+        revision = decompression_service.registry.get(tableRevision)
+        return payload_service.response(
+            request,
+            ("table-grid", revision.content_hash),
+            lambda: decompression_service.get_table_grid(revision.name)
+        )
+    except Exception as e:
+        logging.error(f"Table grid error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.post("/oxygen/daily-exposure", response_model=DailyExposure)
+async def calculate_daily_oxygen_exposure(request: DailyExposureRequest):
+    """
+    CNS% and OTU for each dive of a day and their running totals
+    """
+    try:
+        return decompression_service.calculate_daily_exposure(request.dives, request.tableRevision)
+    except Exception as e:
+        logging.error(f"Oxygen exposure error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Stored multi-dive plans
+@api_router.post("/plans", response_model=DivePlan)
+async def create_dive_plan(request: DivePlanRequest):
+    """
+    Compute and store a day's chain of repetitive dives
+    """
+    try:
+        return await dive_plan_service.create_plan(request)
+    except Exception as e:
+        logging.error(f"Dive plan creation error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/plans/{plan_id}", response_model=DivePlan)
+async def get_dive_plan(plan_id: str):
+    try:
+        return await dive_plan_service.get_plan(plan_id)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@api_router.put("/plans/{plan_id}/dives/{dive_number}", response_model=DivePlanUpdate)
+async def update_dive_plan_dive(plan_id: str, dive_number: int, request: DivePlanDiveInput):
+    """
+    Edit one dive; only it and the later dives whose carried state changes are recomputed
+    """
+    try:
+        return await dive_plan_service.update_dive(plan_id, dive_number, request)
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+    except Exception as e:
+        logging.error(f"Dive plan update error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+# Shareable results
+@api_router.post("/share", response_model=ShareLink)
+async def share_result(request: ShareRequest):
+    """
+    Store a calculation or plan under the hash of its inputs and table version
+    """
+    try:
+        return await share_service.share(request)
+    except Exception as e:
+        logging.error(f"Share error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/share/{share_id}")
+async def get_shared_result(share_id: str):
+    """
+    The stored result exactly as computed when it was shared
+    """
+    try:
+        return Response(content=await share_service.get_shared(share_id), media_type="application/json")
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+# Live dive sessions
+@api_router.post("/sessions", response_model=DiveSessionInfo)
+async def start_dive_session(request: DiveSessionRequest):
+    """
+    Start a supervised dive from its computed schedule
+    """
+    try:
+        return dive_session_service.start_session(request).to_info()
+    except Exception as e:
+        logging.error(f"Dive session start error: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+
+@api_router.get("/sessions", response_model=List[DiveSessionInfo])
+async def list_dive_sessions():
+    return [session.to_info() for session in dive_session_service.list_sessions()]
+
+@api_router.get("/sessions/events")
+async def stream_dive_session_events(sessionId: Optional[str] = None):
+    """
+    Server-Sent Events feed of phase changes, for one session or all of them
+    """
+    if not dive_session_service.is_live(sessionId):
+        raise HTTPException(status_code=404, detail=f"Sesión de buceo no activa: {sessionId}")
+    queue = dive_session_service.subscribe(sessionId)
+
+    async def event_stream():
+        try:
+            while True:
+                try:
+                    event = await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                yield f"event: {event['event']}\ndata: {json.dumps(event, ensure_ascii=False)}\n\n"
+                if sessionId is not None and event["event"] in FINAL_EVENTS:
+                    break
+        finally:
+            dive_session_service.unsubscribe(queue, sessionId)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@api_router.websocket("/sessions/ws")
+async def dive_session_websocket(websocket: WebSocket, sessionId: Optional[str] = None):
+    """
+    WebSocket feed of phase changes, for one session or all of them
+    """
+    await websocket.accept()
+    if not dive_session_service.is_live(sessionId):
+        await websocket.close(code=1000, reason="session not running")
+        return
+
+    # Listen for the client alongside the queue, so a disconnect is noticed even
+    # when no more events are coming
+    queue = dive_session_service.subscribe(sessionId)
+    receive = asyncio.ensure_future(websocket.receive())
+    next_event = asyncio.ensure_future(queue.get())
+    try:
+        while True:
+            done, _ = await asyncio.wait((receive, next_event), return_when=asyncio.FIRST_COMPLETED)
+            if receive in done:
+                if receive.result()["type"] == "websocket.disconnect":
+                    break
+                receive = asyncio.ensure_future(websocket.receive())  # client messages are ignored
+            if next_event in done:
+                event = next_event.result()
+                await websocket.send_json(event)
+                if sessionId is not None and event["event"] in FINAL_EVENTS:
+                    await websocket.close(code=1000)
+                    break
+                next_event = asyncio.ensure_future(queue.get())
+    except WebSocketDisconnect:
+        pass
+    finally:
+        receive.cancel()
+        next_event.cancel()
+        dive_session_service.unsubscribe(queue, sessionId)
+
+@api_router.get("/sessions/{session_id}", response_model=DiveSessionInfo)
+async def get_dive_session(session_id: str):
+    try:
+        return dive_session_service.get_session(session_id).to_info()
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+@api_router.delete("/sessions/{session_id}", response_model=DiveSessionInfo)
+async def cancel_dive_session(session_id: str):
+    try:
+        return dive_session_service.cancel_session(session_id).to_info()
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=str(e.args[0]))
+
+# Probes for the load balancer (outside /api)
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving"""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: tables loaded and warmed, safe to route traffic here"""
+    if not app_state["ready"]:
+        return JSONResponse(
+            status_code=503,
+            content={"status": "warming_up", "error": app_state["warmup_error"]}
+        )
+    return {"status": "ready"}
+
 # Include the router in the main app
 app.include_router(api_router)
 
@@ -120,8 +461,4 @@ logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
 )
-logger = logging.getLogger(__name__)
-
-@app.on_event("shutdown")
-async def shutdown_db_client():
-    client.close()
\ No newline at end of file
+logger = logging.getLogger(__name__)
\ No newline at end of file
@@ -0,0 +1,116 @@
+from datetime import datetime
+from typing import Optional, Tuple
+from bson import Binary
+from pymongo.errors import DuplicateKeyError
+from models import ShareLink, ShareRequest
+from decompression_service import decompression_service, hash_content
+from plan_service import dive_plan_service
+from database import get_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+SHARES_COLLECTION = "shared_results"
+# Hex characters of the content hash used as the public ID
+SHORT_ID_LENGTH = 12
+
+
+class ShareService:
+    """
+    Content-addressed storage of computed calculations and plans.
+
+    The ID is derived from the canonical inputs plus the table revision's
+    content hash, so identical shares land on the same document (unique index
+    on the full hash) and a stored result never changes when tables are
+    reloaded: it is returned as the bytes that were computed at share time.
+    """
+
+    def __init__(self, service=decompression_service, plans=dive_plan_service):
+        self.service = service
+        self.plans = plans
+        self._indexes_created = False
+
+    def _collection(self):
+        return get_db()[SHARES_COLLECTION]
+
+    async def _ensure_indexes(self):
+        if not self._indexes_created:
+            await self._collection().create_index("contentHash", unique=True)
+            self._indexes_created = True
+
+    def _resolve(self, request: ShareRequest) -> Tuple[str, dict, Optional[str]]:
+        """kind, canonical inputs and table revision of a share request"""
+        if (request.calculation is None) == (request.plan is None):
+            raise Exception("Debe enviar exactamente uno de: calculation o plan.")
+        if request.calculation is not None:
+            return "calculation", request.calculation.model_dump(), request.calculation.tableRevision
+        return "plan", request.plan.model_dump(), request.plan.tableRevision
+
+    def _compute(self, request: ShareRequest, share_id: str) -> bytes:
+        if request.calculation is not None:
+            calculation = request.calculation
+            result = self.service.calculate_decompression(
+                max_depth=calculation.maxDepth,
+                bottom_time=calculation.bottomTime,
+                altitude=calculation.altitude,
+                breathing_gas=calculation.breathingGas,
+                oxygen_deco=calculation.oxygenDeco,
+                include_hints=calculation.includeScheduleHints,
+                table_revision=calculation.tableRevision,
+                include_oxygen_exposure=calculation.includeOxygenExposure
+            )
+        else:
+            result = self.plans.build_plan(request.plan).model_copy(update={"id": share_id})
+        return result.model_dump_json().encode('utf-8')
+
+    async def share(self, request: ShareRequest) -> ShareLink:
+        """Store the computed result under its content hash, or return the existing ID"""
+        kind, inputs, table_revision = self._resolve(request)
+        revision = self.service.registry.get(table_revision)
+        content_hash = hash_content({"kind": kind, "inputs": inputs, "table": revision.content_hash})
+        share_id = content_hash[:SHORT_ID_LENGTH]
+        link = ShareLink(
+            id=share_id,
+            contentHash=content_hash,
+            kind=kind,
+            tableUsed=revision.name,
+            tableHash=revision.content_hash,
+            created=False
+        )
+
+        await self._ensure_indexes()
+        collection = self._collection()
+        if await collection.find_one({"contentHash": content_hash}, {"_id": 1}) is not None:
+            return link
+
+        document = {
+            "_id": share_id,
+            "contentHash": content_hash,
+            "kind": kind,
+            "inputs": inputs,
+            "tableUsed": revision.name,
+            "tableHash": revision.content_hash,
+            "body": Binary(self._compute(request, share_id)),
+            "createdAt": datetime.utcnow(),
+        }
+        try:
+            await collection.insert_one(document)
+            link.created = True
+            logger.info(f"Shared {kind} {share_id}")
+        except DuplicateKeyError:
+            # A concurrent identical share won, or (practically never) a short ID collision
+            existing = await collection.find_one({"_id": share_id}, {"contentHash": 1})
+            if existing is None or existing["contentHash"] != content_hash:
+                raise Exception("Colisión de identificador al compartir; inténtelo de nuevo.")
+        return link
+
+    async def get_shared(self, share_id: str) -> bytes:
+        """Stored result bytes for a share ID (one read on _id, nothing recomputed)"""
+        document = await self._collection().find_one({"_id": share_id}, {"body": 1})
+        if document is None:
+            raise KeyError(f"Resultado compartido no encontrado: {share_id}")
+        return bytes(document["body"])
+
+
+# Global service instance
+share_service = ShareService()
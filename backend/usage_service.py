@@ -0,0 +1,293 @@
+import asyncio
+import json
+import os
+import threading
+from collections import Counter, OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+from pymongo import UpdateOne
+from models import DecompressionRequest, HotCell, HotCellHistogram
+from decompression_service import decompression_service
+from database import get_db
+import logging
+
+logger = logging.getLogger(__name__)
+
+USAGE_COLLECTION = "cell_usage"
+# Pending counts are written to Mongo this often (seconds), never per request
+USAGE_FLUSH_SECONDS = float(os.environ.get('USAGE_FLUSH_SECONDS', '30'))
+# Days of daily buckets summed into the rolling counts
+USAGE_WINDOW_DAYS = int(os.environ.get('USAGE_WINDOW_DAYS', '7'))
+PREWARM_TOP_CELLS = int(os.environ.get('PREWARM_TOP_CELLS', '50'))
+# Upper bound on the cells one histogram request may ask for
+MAX_HISTOGRAM_CELLS = 1000
+RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', '4096'))
+# Distinct raw requests remembered per cell for prewarming; the least frequent go first
+TOP_REQUESTS_PER_CELL = 8
+# Consecutive failed flushes after which pending counts are dropped rather than kept
+MAX_FLUSH_FAILURES = int(os.environ.get('USAGE_MAX_FLUSH_FAILURES', '20'))
+
+# (table name, rounded depth, rounded time)
+CellKey = Tuple[str, float, int]
+# (table content hash, request JSON)
+CacheKey = Tuple[str, str]
+
+
+class ResponseCache:
+    """
+    LRU of serialized /decompression/calculate bodies keyed by the full request
+    and the content hash of the table it resolves to, so a reloaded table
+    never serves bodies computed from its previous content
+    """
+
+    def __init__(self, max_entries: int = RESPONSE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[CacheKey, Tuple[bytes, CellKey]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def key(self, request: DecompressionRequest, content_hash: str) -> CacheKey:
+        return content_hash, json.dumps(request.model_dump(), sort_keys=True)
+
+    def get(self, key: CacheKey) -> Optional[Tuple[bytes, CellKey]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: CacheKey, entry: Tuple[bytes, CellKey]):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def __contains__(self, key: CacheKey) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CellUsageService:
+    """
+    Counts the rounded table cells actually requested and serves calculations
+    from the response cache.
+
+    Counts accumulate in memory and are flushed to Mongo as one unordered bulk
+    of $inc upserts per interval, into one document per cell per day. The
+    rolling window is the sum of the last USAGE_WINDOW_DAYS days; older
+    buckets expire through a TTL index.
+    """
+
+    def __init__(self, service=decompression_service, cache: Optional[ResponseCache] = None):
+        self.service = service
+        self.cache = cache or ResponseCache()
+        self._pending: Counter = Counter()
+        # Top raw requests per cell since the last flush (bounded), kept for prewarming
+        self._requests: Dict[Tuple[str, CellKey], Counter] = {}
+        self._indexes_created = False
+        self._flush_failures = 0
+        self._task: Optional[asyncio.Task] = None
+
+    def cache_key(self, request: DecompressionRequest) -> CacheKey:
+        return self.cache.key(request, self.service.registry.get(request.tableRevision).content_hash)
+
+    def calculate(self, request: DecompressionRequest) -> bytes:
+        """Serialized result for a request, from the cache when possible"""
+        key = self.cache_key(request)
+        entry = self.cache.get(key)
+        if entry is None:
+            entry = self._compute(request)
+            self.cache.put(key, entry)
+        self.record(entry[1], key[1])
+        return entry[0]
+
+    def _compute(self, request: DecompressionRequest) -> Tuple[bytes, CellKey]:
+        result = self.service.calculate_decompression(
+            max_depth=request.maxDepth,
+            bottom_time=request.bottomTime,
+            altitude=request.altitude,
+            breathing_gas=request.breathingGas,
+            oxygen_deco=request.oxygenDeco,
+            include_hints=request.includeScheduleHints,
+            table_revision=request.tableRevision,
+            include_oxygen_exposure=request.includeOxygenExposure
+        )
+        cell = (result.tableUsed, result.roundedValues.depth, result.roundedValues.time)
+        return result.model_dump_json().encode('utf-8'), cell
+
+    def record(self, cell: CellKey, request_key: Optional[str] = None):
+        day = datetime.utcnow().strftime('%Y-%m-%d')
+        self._pending[(day, cell)] += 1
+        if request_key is not None:
+            self._count_request((day, cell), request_key)
+
+    def _count_request(self, key: Tuple[str, CellKey], request_key: str, count: int = 1):
+        """Bounded top-k of raw requests per cell: a new request evicts the least frequent one"""
+        request_counts = self._requests.setdefault(key, Counter())
+        if request_key not in request_counts and len(request_counts) >= TOP_REQUESTS_PER_CELL:
+            del request_counts[min(request_counts, key=request_counts.get)]
+        request_counts[request_key] += count
+
+    async def _ensure_indexes(self, collection):
+        if not self._indexes_created:
+            await collection.create_index("expiresAt", expireAfterSeconds=0)
+            await collection.create_index([("day", 1), ("count", -1)])
+            self._indexes_created = True
+
+    async def flush(self) -> int:
+        """
+        Write the pending counts as one bulk of upserts. Counts are kept on
+        failure, until MAX_FLUSH_FAILURES consecutive failures drop them so an
+        unreachable database cannot grow memory without bound.
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, Counter()
+        requests, self._requests = self._requests, {}
+        operations = []
+        for (day, cell), count in pending.items():
+            table_name, depth, time = cell
+            update = {
+                "$inc": {"count": count},
+                "$set": {
+                    "day": day,
+                    "tableUsed": table_name,
+                    "depth": depth,
+                    "time": time,
+                    "expiresAt": datetime.strptime(day, '%Y-%m-%d') + timedelta(days=USAGE_WINDOW_DAYS + 1),
+                },
+            }
+            request_counts = requests.get((day, cell))
+            if request_counts:
+                update["$set"]["topRequest"] = json.loads(request_counts.most_common(1)[0][0])
+            operations.append(UpdateOne({"_id": f"{day}|{table_name}|{depth}|{time}"}, update, upsert=True))
+
+        try:
+            collection = get_db()[USAGE_COLLECTION]
+            await self._ensure_indexes(collection)
+            await collection.bulk_write(operations, ordered=False)
+        except Exception as e:
+            self._flush_failures += 1
+            if self._flush_failures >= MAX_FLUSH_FAILURES:
+                logger.error(f"Cell usage flush failed {self._flush_failures} times, dropping {len(operations)} pending cells: {e}")
+                self._flush_failures = 0
+                return 0
+            logger.error(f"Cell usage flush failed, keeping {len(operations)} pending cells: {e}")
+            self._pending.update(pending)
+            for key, request_counts in requests.items():
+                for request_key, count in request_counts.items():
+                    self._count_request(key, request_key, count)
+            return 0
+
+        self._flush_failures = 0
+        logger.info(f"Flushed usage counts for {len(operations)} cells")
+        return len(operations)
+
+    async def _run(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            await self.flush()
+
+    def start(self, interval: float = USAGE_FLUSH_SECONDS):
+        if self._task is None or self._task.done():
+            self._task = asyncio.get_running_loop().create_task(self._run(interval))
+
+    async def stop(self):
+        """Stop the periodic flush and write what is left (on shutdown)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def top_cells(self, limit: int = PREWARM_TOP_CELLS, days: int = USAGE_WINDOW_DAYS) -> List[dict]:
+        """Cells with the highest persisted counts over the last `days` days"""
+        cutoff = (datetime.utcnow() - timedelta(days=days - 1)).strftime('%Y-%m-%d')
+        pipeline = [
+            {"$match": {"day": {"$gte": cutoff}}},
+            {"$sort": {"day": 1}},
+            {"$group": {
+                "_id": {"tableUsed": "$tableUsed", "depth": "$depth", "time": "$time"},
+                "count": {"$sum": "$count"},
+                "topRequest": {"$last": "$topRequest"},
+            }},
+            {"$sort": {"count": -1}},
+            {"$limit": limit},
+        ]
+        rows = await get_db()[USAGE_COLLECTION].aggregate(pipeline).to_list(limit)
+        return [{**row["_id"], "count": row["count"], "topRequest": row.get("topRequest")} for row in rows]
+
+    async def get_histogram(self, limit: int = PREWARM_TOP_CELLS, days: int = USAGE_WINDOW_DAYS) -> HotCellHistogram:
+        """Persisted rolling counts plus this worker's not yet flushed counts"""
+        counts = Counter()
+        for row in await self.top_cells(limit, days):
+            counts[(row["tableUsed"], row["depth"], row["time"])] += row["count"]
+        unflushed = 0
+        for (_, cell), count in self._pending.items():
+            counts[cell] += count
+            unflushed += count
+
+        return HotCellHistogram(
+            windowDays=days,
+            unflushedRequests=unflushed,
+            cells=[
+                HotCell(tableUsed=table_name, depth=depth, time=time, count=count)
+                for (table_name, depth, time), count in counts.most_common(limit)
+            ]
+        )
+
+    def _prewarm_requests(self, row: dict) -> List[DecompressionRequest]:
+        """The most frequent raw request for a hot cell plus the plain table inputs"""
+        requests = []
+        if row.get("topRequest"):
+            try:
+                requests.append(DecompressionRequest(**row["topRequest"]))
+            except Exception:
+                pass
+        for oxygen_deco in ("No", "Si"):
+            requests.append(DecompressionRequest(
+                maxDepth=row["depth"], bottomTime=row["time"], altitude=0,
+                breathingGas="Aire", oxygenDeco=oxygen_deco,
+                tableRevision=None if row["tableUsed"] == self.service.registry.get().name else row["tableUsed"]
+            ))
+        return requests
+
+    def _prewarm_cells(self, rows: List[dict]) -> int:
+        warmed = 0
+        for row in rows:
+            for request in self._prewarm_requests(row):
+                try:
+                    key = self.cache_key(request)
+                    if key in self.cache:
+                        continue
+                    self.cache.put(key, self._compute(request))
+                    warmed += 1
+                except Exception:
+                    pass  # e.g. a revision no longer loaded
+        return warmed
+
+    async def prewarm(self, top_n: int = PREWARM_TOP_CELLS) -> int:
+        """Fill the response cache with the top-N cells of the rolling window"""
+        try:
+            rows = await self.top_cells(top_n)
+        except Exception as e:
+            logger.error(f"Could not read hot cells for prewarming: {e}")
+            return 0
+        warmed = await asyncio.to_thread(self._prewarm_cells, rows)
+        logger.info(f"Prewarmed {warmed} responses for {len(rows)} hot cells")
+        return warmed
+
+
+# Global service instance
+usage_service = CellUsageService()
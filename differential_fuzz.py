@@ -0,0 +1,358 @@
+#!/usr/bin/env python3
+"""
+Differential fuzzing for the US Navy Rev.7 decompression table lookups.
+
+The original linear implementation (find_equal_or_next_greater,
+find_table_entry, extract_decompression_stops) is vendored below as the
+oracle, reading decompression_table.json on its own, so later changes to the
+service or its table registry cannot change the reference along with the
+candidate. The indexed path (find_cell / calculate_decompression) must
+return exactly the same result or the same error for every input. Inputs are
+exact table depths and times, values just above and below them, random
+values, out-of-range exposures and every tabla_3 altitude bucket, spread
+across worker processes.
+
+Nitrox cases check the precomputed EAD thresholds (table_depth_for_gas)
+against the EAD rounded up to the next table depth by the oracle. The
+thresholds are floored to the centimetre, so a result one table depth deeper
+is accepted only within 1 cm of a boundary; anything shallower is a
+divergence.
+
+Usage: python differential_fuzz.py --cases 2000000 --workers 8
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import sys
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(ROOT_DIR, 'backend'))
+
+from models import ActualInputs, DecompressionResult, DecompressionStop, RoundedValues, TableEntry  # noqa: E402
+from decompression_service import DecompressionService  # noqa: E402
+
+TABLE_PATH = os.path.join(ROOT_DIR, 'decompression_table.json')
+TABLA_3_PATH = os.path.join(ROOT_DIR, 'tables', 'tabla_3.json')
+
+# Offsets used to probe either side of a table boundary
+DEPTH_EPSILONS = (0.001, 0.01, 0.05, 0.1, 0.5)
+TIME_OFFSETS = (1, 2, 5)
+# Nitrox oxygen fractions probed besides random ones (21-40 %)
+NITROX_FRACTIONS = (0.32, 0.36)
+# EAD constants, independent of the service's
+AIR_NITROGEN_FRACTION = 0.79
+METERS_PER_ATMOSPHERE = 10.0
+# Resolution of the precomputed nitrox thresholds (meters)
+THRESHOLD_RESOLUTION = 0.01
+
+
+class BaselineTable:
+    """The original linear lookups, frozen: the oracle both paths are compared against"""
+
+    def __init__(self, table_path: str = TABLE_PATH):
+        with open(table_path, 'r', encoding='utf-8') as f:
+            raw_data = json.load(f)
+        self.table_data = []
+        for entry in raw_data:
+            try:
+                self.table_data.append(TableEntry(**entry))
+            except Exception:
+                continue
+
+    def get_available_depths(self) -> List[float]:
+        depths = list(set([entry.profundidad_m for entry in self.table_data]))
+        return sorted(depths)
+
+    def get_available_times_for_depth(self, depth: float) -> List[int]:
+        times = [entry.tiempo_fondo_min for entry in self.table_data
+                 if entry.profundidad_m == depth]
+        return sorted(list(set(times)))
+
+    def get_max_time_for_depth(self, depth: float) -> Optional[int]:
+        times = self.get_available_times_for_depth(depth)
+        return max(times) if times else None
+
+    def find_equal_or_next_greater(self, target: float, available_values: List[float]) -> float:
+        available_values = sorted(available_values)
+        for value in available_values:
+            if value >= target:
+                return value
+        return max(available_values) if available_values else target
+
+    def find_table_entry(self, depth: float, time: int) -> Optional[TableEntry]:
+        for entry in self.table_data:
+            if entry.profundidad_m == depth and entry.tiempo_fondo_min == time:
+                return entry
+        return None
+
+    def extract_decompression_stops(self, entry: TableEntry) -> List[DecompressionStop]:
+        stop_depths = [
+            (39.6, entry.parada_39_6m),
+            (36.6, entry.parada_36_6m),
+            (33.5, entry.parada_33_5m),
+            (30.5, entry.parada_30_5m),
+            (27.4, entry.parada_27_4m),
+            (24.4, entry.parada_24_4m),
+            (21.3, entry.parada_21_3m),
+            (18.3, entry.parada_18_3m),
+            (15.2, entry.parada_15_2m),
+            (12.2, entry.parada_12_2m),
+            (9.1, entry.parada_9_1m),
+            (6.1, entry.parada_6_1m),
+        ]
+        return [DecompressionStop(depth=depth, duration=duration)
+                for depth, duration in stop_depths if duration is not None and duration > 0]
+
+    def calculate_time_to_first_stop(self, max_depth: float, first_stop_depth: float) -> int:
+        if not first_stop_depth:
+            return 0
+        return max(1, round((max_depth - first_stop_depth) / 9.0))
+
+
+service: Optional[DecompressionService] = None
+baseline: Optional[BaselineTable] = None
+table_depths: List[float] = []
+table_times: Dict[float, List[int]] = {}
+altitudes: List[float] = []
+
+
+def init_worker():
+    """Load both tables once per process and silence per-calculation logging"""
+    global service, baseline, table_depths, table_times, altitudes
+    logging.disable(logging.CRITICAL)
+    service = DecompressionService()
+    service.load()
+    baseline = BaselineTable()
+    table_depths = baseline.get_available_depths()
+    table_times = {depth: baseline.get_available_times_for_depth(depth) for depth in table_depths}
+
+    with open(TABLA_3_PATH, 'r', encoding='utf-8') as f:
+        buckets = [row['Altitud (m)'] for row in json.load(f)]
+    altitudes = sorted({0.0, *buckets, *(bucket - 1 for bucket in buckets), *(bucket + 1 for bucket in buckets)})
+
+
+def reference_calculate(max_depth: float, bottom_time: int, altitude: float,
+                        breathing_gas: str, oxygen_deco: str) -> DecompressionResult:
+    """The original linear calculation, step for step"""
+    available_depths = baseline.get_available_depths()
+    rounded_depth = baseline.find_equal_or_next_greater(max_depth, available_depths)
+
+    available_times = baseline.get_available_times_for_depth(rounded_depth)
+    max_time = baseline.get_max_time_for_depth(rounded_depth)
+    if max_time and bottom_time > max_time:
+        raise Exception("No se puede tabular esa inmersión por demasiada exposición.")
+
+    rounded_time = int(baseline.find_equal_or_next_greater(bottom_time, available_times))
+    table_entry = baseline.find_table_entry(rounded_depth, rounded_time)
+    if not table_entry:
+        raise Exception(f"No table entry found for depth {rounded_depth}m and time {rounded_time} minutes")
+
+    decompression_stops = baseline.extract_decompression_stops(table_entry)
+    first_stop_depth = decompression_stops[0].depth if decompression_stops else None
+    time_to_first_stop = baseline.calculate_time_to_first_stop(max_depth, first_stop_depth) if first_stop_depth else 0
+
+    return DecompressionResult(
+        noDecompressionDive=len(decompression_stops) == 0,
+        decompressionStops=decompression_stops,
+        actualInputs=ActualInputs(depth=max_depth, bottomTime=bottom_time),
+        roundedValues=RoundedValues(depth=rounded_depth, time=rounded_time),
+        tableUsed="US Navy Rev 7 – Tabla de Aire I",
+        tableCell=f"Profundidad: {rounded_depth}m / Tiempo: {rounded_time}min",
+        altitude=altitude,
+        breathingGas=breathing_gas,
+        oxygenDeco=oxygen_deco,
+        totalAscentTime=table_entry.tiempo_total_ascenso,
+        repetitiveGroup=table_entry.grupo_repeticion,
+        timeToFirstStop=time_to_first_stop
+    )
+
+
+def optimized_calculate(max_depth: float, bottom_time: int, altitude: float,
+                        breathing_gas: str, oxygen_deco: str) -> DecompressionResult:
+    return service.calculate_decompression(max_depth, bottom_time, altitude, breathing_gas, oxygen_deco)
+
+
+def reference_gas_depth(real_depth: float, oxygen_fraction: float) -> float:
+    """Table depth for a nitrox dive: the EAD rounded up by the original lookup"""
+    ead = (real_depth + METERS_PER_ATMOSPHERE) * (1 - oxygen_fraction) / AIR_NITROGEN_FRACTION - METERS_PER_ATMOSPHERE
+    return baseline.find_equal_or_next_greater(ead, table_depths)
+
+
+def gas_divergence(real_depth: float, oxygen_fraction: float) -> Optional[Dict[str, Any]]:
+    """
+    None when table_depth_for_gas matches the EAD round-up, or is the next
+    deeper table depth within THRESHOLD_RESOLUTION of a boundary
+    """
+    expected = reference_gas_depth(real_depth, oxygen_fraction)
+    actual = service.registry.get().table_depth_for_gas(real_depth, oxygen_fraction)
+    if actual == expected:
+        return None
+    if actual > expected and reference_gas_depth(real_depth + THRESHOLD_RESOLUTION, oxygen_fraction) >= actual:
+        return None
+    return {"reference": expected, "optimized": actual}
+
+
+def run_path(function, case: Tuple) -> Tuple[str, Any]:
+    try:
+        return "ok", function(*case).model_dump()
+    except Exception as e:
+        return "error", str(e)
+
+
+def generate_case(rng: random.Random) -> Tuple[str, Tuple]:
+    """One (category, inputs) pair; categories are weighted towards table boundaries"""
+    altitude = rng.choice(altitudes)
+    breathing_gas = rng.choice(("Air", "aire"))
+    oxygen_deco = rng.choice(("No", "Yes", "no", "si"))
+    depth = rng.choice(table_depths)
+    times = table_times[depth]
+    time_value = rng.choice(times)
+    kind = rng.random()
+
+    if kind < 0.25:
+        category = "exact"
+    elif kind < 0.45:
+        category = "just_above"
+        depth = round(depth + rng.choice(DEPTH_EPSILONS), 3)
+        time_value += rng.choice(TIME_OFFSETS)
+    elif kind < 0.60:
+        category = "just_below"
+        depth = round(max(0.1, depth - rng.choice(DEPTH_EPSILONS)), 3)
+        time_value = max(1, time_value - rng.choice(TIME_OFFSETS))
+    elif kind < 0.75:
+        category = "out_of_range_time"
+        time_value = times[-1] + rng.randint(1, 500)
+    elif kind < 0.85:
+        category = "out_of_range_depth"
+        depth = round(table_depths[-1] + rng.uniform(0.001, 50), 2)
+        time_value = rng.randint(1, 500)
+    else:
+        category = "random"
+        depth = round(rng.uniform(0.1, table_depths[-1] + 10), rng.choice((0, 1, 2)))
+        time_value = rng.randint(1, times[-1] + 60)
+
+    return category, (depth, time_value, altitude, breathing_gas, oxygen_deco)
+
+
+def generate_gas_case(rng: random.Random) -> Tuple[str, Tuple]:
+    """One nitrox (category, (real depth, oxygen fraction)) pair, weighted towards EAD boundaries"""
+    oxygen_fraction = rng.choice(NITROX_FRACTIONS) if rng.random() < 0.5 else rng.randint(22, 40) / 100
+    if rng.random() < 0.7:
+        # Real depth whose EAD is exactly a table depth, probed on either side
+        depth = rng.choice(table_depths)
+        boundary = (depth + METERS_PER_ATMOSPHERE) * AIR_NITROGEN_FRACTION / (1 - oxygen_fraction) - METERS_PER_ATMOSPHERE
+        offset = rng.choice((0.0, *DEPTH_EPSILONS, *(-epsilon for epsilon in DEPTH_EPSILONS)))
+        return "nitrox_boundary", (round(max(0.1, boundary + offset), 3), oxygen_fraction)
+    return "nitrox_random", (round(rng.uniform(0.1, table_depths[-1] + 10), rng.choice((0, 1, 2))), oxygen_fraction)
+
+
+def run_chunk(task: Tuple[int, int, int, float]) -> Dict[str, Any]:
+    """Generate and check one chunk of cases; both paths are timed separately"""
+    chunk_index, seed, size, nitrox_share = task
+    rng = random.Random(seed * 1_000_003 + chunk_index)
+    gas_size = int(size * nitrox_share)
+    cases = [generate_case(rng) for _ in range(size - gas_size)]
+    gas_cases = [generate_gas_case(rng) for _ in range(gas_size)]
+
+    started = time.perf_counter()
+    expected = [run_path(reference_calculate, case) for _, case in cases]
+    oracle_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    actual = [run_path(optimized_calculate, case) for _, case in cases]
+    optimized_seconds = time.perf_counter() - started
+
+    categories = Counter()
+    outcomes = Counter()
+    divergences = []
+    for (category, case), reference, candidate in zip(cases, expected, actual):
+        categories[category] += 1
+        outcomes[reference[0]] += 1
+        if reference != candidate:
+            divergences.append({
+                "category": category,
+                "inputs": case,
+                "reference": reference,
+                "optimized": candidate,
+            })
+
+    for category, case in gas_cases:
+        categories[category] += 1
+        divergence = gas_divergence(*case)
+        if divergence is not None:
+            divergences.append({"category": category, "inputs": case, **divergence})
+
+    return {
+        "cases": size,
+        "timed_cases": len(cases),
+        "oracle_seconds": oracle_seconds,
+        "optimized_seconds": optimized_seconds,
+        "categories": categories,
+        "outcomes": outcomes,
+        "divergences": divergences,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Differential fuzzing of indexed vs. linear table lookups")
+    parser.add_argument("--cases", type=int, default=1_000_000, help="total number of generated inputs")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="worker processes")
+    parser.add_argument("--chunk-size", type=int, default=5_000, help="inputs per task")
+    parser.add_argument("--seed", type=int, default=0, help="seed for reproducible runs")
+    parser.add_argument("--max-report", type=int, default=20, help="divergences printed in full")
+    parser.add_argument("--nitrox-share", type=float, default=0.2, help="share of inputs that are nitrox EAD lookups")
+    args = parser.parse_args()
+
+    tasks = []
+    remaining = args.cases
+    while remaining > 0:
+        size = min(args.chunk_size, remaining)
+        tasks.append((len(tasks), args.seed, size, args.nitrox_share))
+        remaining -= size
+
+    print(f"Checking {args.cases} inputs in {len(tasks)} chunks on {args.workers} workers (seed {args.seed})")
+
+    totals = Counter()
+    categories = Counter()
+    outcomes = Counter()
+    divergences = []
+    started = time.perf_counter()
+
+    with multiprocessing.Pool(args.workers, initializer=init_worker) as pool:
+        for report in pool.imap_unordered(run_chunk, tasks):
+            totals["cases"] += report["cases"]
+            totals["timed_cases"] += report["timed_cases"]
+            totals["oracle_seconds"] += report["oracle_seconds"]
+            totals["optimized_seconds"] += report["optimized_seconds"]
+            categories.update(report["categories"])
+            outcomes.update(report["outcomes"])
+            divergences.extend(report["divergences"])
+
+    wall_seconds = time.perf_counter() - started
+    timed_cases = totals["timed_cases"]
+
+    print(f"\nInputs by category: {dict(sorted(categories.items()))}")
+    print(f"Reference outcomes: {dict(sorted(outcomes.items()))}")
+    print(f"Oracle (linear) throughput:     {timed_cases / totals['oracle_seconds']:,.0f} cases/s per worker")
+    print(f"Optimized (indexed) throughput: {timed_cases / totals['optimized_seconds']:,.0f} cases/s per worker")
+    print(f"Speedup: {totals['oracle_seconds'] / totals['optimized_seconds']:.1f}x, wall time {wall_seconds:.1f}s")
+
+    if divergences:
+        print(f"\n❌ {len(divergences)} divergences found")
+        for divergence in divergences[:args.max_report]:
+            print(json.dumps(divergence, ensure_ascii=False, default=str))
+        return 1
+
+    print("\n✅ No divergences: indexed lookups match the linear reference")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
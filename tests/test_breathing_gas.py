@@ -0,0 +1,79 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from decompression_service import (  # noqa: E402
+    decompression_service, equivalent_air_depth, max_operating_depth, parse_breathing_gas
+)
+
+
+@pytest.mark.parametrize("name, fraction", [
+    ("Air", 0.21), ("aire", 0.21), (" AIRE ", 0.21),
+    ("EAN32", 0.32), ("EANx32", 0.32), ("ean-36", 0.36), ("Nitrox 36", 0.36),
+    ("nx32", 0.32), ("32%", 0.32), ("40", 0.40), ("EAN21", 0.21),
+])
+def test_accepted_gas_spellings(name, fraction):
+    assert parse_breathing_gas(name) == fraction
+
+
+@pytest.mark.parametrize("name", ["EAN20", "EAN41", "Nitrox 50"])
+def test_mixes_outside_nitrox_range_are_refused(name):
+    with pytest.raises(Exception, match="fuera de rango"):
+        parse_breathing_gas(name)
+
+
+@pytest.mark.parametrize("name", ["", "Trimix 18/45", "EAN", "heliox", "EAN320"])
+def test_unknown_gases_are_refused(name):
+    with pytest.raises(Exception, match="no soportado"):
+        parse_breathing_gas(name)
+
+
+def test_equivalent_air_depth_and_mod():
+    assert equivalent_air_depth(30, 0.32) == pytest.approx(24.43, abs=0.01)
+    assert equivalent_air_depth(30, 0.21) == pytest.approx(30)
+    assert max_operating_depth(0.32) == pytest.approx(33.75)
+    assert max_operating_depth(0.32, 1.6) == pytest.approx(40.0)
+
+
+def test_check_gas_air_is_unchecked():
+    assert decompression_service.check_gas(60, 0.21) is None
+
+
+def test_check_gas_within_working_limit():
+    check = decompression_service.check_gas(30, 0.32)
+    assert check.ppO2Status == "ok" and check.warnings == []
+    assert check.ppO2 == 1.28
+    assert check.maxOperatingDepth == 33.7
+    # The EAD is rounded up so the air table is never entered too shallow
+    assert check.equivalentAirDepth == 24.5
+
+
+def test_check_gas_warns_above_working_limit():
+    check = decompression_service.check_gas(36, 0.32)
+    assert check.ppO2Status == "warning"
+    assert check.ppO2 == 1.47
+    assert len(check.warnings) == 1 and "MOD (33.7m)" in check.warnings[0]
+
+
+def test_check_gas_refuses_above_maximum():
+    with pytest.raises(Exception, match="supera el máximo de 1.6 ata"):
+        decompression_service.check_gas(41, 0.32)
+
+
+def test_nitrox_result_uses_equivalent_air_depth():
+    result = decompression_service.calculate_decompression(30, 30, 0, "EAN32", "No")
+    assert result.gasCheck.equivalentAirDepth == 24.5
+    assert result.roundedValues.depth < 30
+    assert result.tableCell.startswith("Profundidad real: 30m / EAD: 24.5m → ")
+
+    air = decompression_service.calculate_decompression(30, 30, 0, "Aire", "No")
+    assert air.gasCheck is None
+    assert air.tableCell == f"Profundidad: {air.roundedValues.depth}m / Tiempo: {air.roundedValues.time}min"
+
+
+def test_nitrox_above_maximum_ppo2_is_refused():
+    with pytest.raises(Exception, match="supera el máximo"):
+        decompression_service.calculate_decompression(45, 20, 0, "EAN36", "No")
@@ -0,0 +1,74 @@
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from bulk_service import MAX_CSV_RECORD_LINES, bulk_service, iter_lines  # noqa: E402
+
+HEADER = "maxDepth,bottomTime,altitude,breathingGas,oxygenDeco,tableRevision,includeScheduleHints,note\n"
+
+
+def parse(data: bytes, chunk_size: int = 1 << 20, input_format: str = "csv"):
+    async def chunks():
+        for start in range(0, len(data), chunk_size):
+            yield data[start:start + chunk_size]
+
+    async def collect():
+        return [row async for row in bulk_service.parse_rows(iter_lines(chunks()), input_format)]
+
+    return asyncio.run(collect())
+
+
+def test_empty_cells_use_model_defaults():
+    rows = parse((HEADER + "30,30,0,Aire,No,,,\n").encode())
+    assert rows == [{"maxDepth": "30", "bottomTime": "30", "altitude": "0", "breathingGas": "Aire", "oxygenDeco": "No"}]
+    assert bulk_service.calculate_row(rows[0]).roundedValues.depth == 30.5
+
+
+@pytest.mark.parametrize("chunk_size", [1, 2, 3, 17, 1 << 20])
+def test_bom_crlf_and_chunk_boundaries(chunk_size):
+    data = ("﻿" + HEADER + "30,30,0,Aire,No,,true,a\r\n18,40,0,Aire,No,,,b\r\n").encode("utf-8")
+    rows = parse(data, chunk_size)
+    assert [row["maxDepth"] for row in rows] == ["30", "18"]
+    assert "maxDepth" in rows[0] and rows[1]["note"] == "b"
+
+
+@pytest.mark.parametrize("chunk_size", [1, 5, 1 << 20])
+def test_quoted_fields_may_span_lines(chunk_size):
+    data = (HEADER + '30,30,0,Aire,No,,,"first\r\n\r\nsecond, with ""quotes"""\n18,40,0,Aire,No,,,x\n').encode()
+    rows = parse(data, chunk_size)
+    assert [row["note"] for row in rows] == ['first\n\nsecond, with "quotes"', "x"]
+
+
+def test_unterminated_quote_at_end_is_reported():
+    rows = parse((HEADER + '18,40,0,Aire,No,,,ok\n20,10,0,Aire,No,,,"open\nmore').encode())
+    assert rows[0]["note"] == "ok"
+    assert rows[1] == {"__error__": "CSV inválido: comillas sin cerrar"}
+    # The lines after the stray quote are parsed again on their own
+    assert rows[2:] == [{"maxDepth": "more"}]
+
+
+def test_stray_quote_resynchronises_and_stays_linear():
+    good = "18,40,0,Aire,No,,,x\n"
+    rows_count = 20_000
+    data = (HEADER + '20,10,0,Aire,No,,,"stray\n' + good * rows_count).encode()
+
+    started = time.perf_counter()
+    rows = parse(data, 4096)
+    elapsed = time.perf_counter() - started
+
+    assert rows[0] == {"__error__": "CSV inválido: comillas sin cerrar"}
+    assert len(rows) == rows_count + 1
+    assert all(row.get("note") == "x" for row in rows[1:])
+    assert elapsed < 2.0
+
+
+def test_record_line_cap():
+    # A quoted field spanning more lines than the cap is treated as a stray quote
+    data = (HEADER + '20,10,0,Aire,No,,,"' + "\n" * (MAX_CSV_RECORD_LINES + 5) + 'end"\n').encode()
+    rows = parse(data)
+    assert rows[0] == {"__error__": "CSV inválido: comillas sin cerrar"}
@@ -0,0 +1,43 @@
+import gzip
+import os
+import sys
+
+import pytest
+from starlette.requests import Request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from compression_service import PrecompressedBody  # noqa: E402
+
+BODY = PrecompressedBody(b'{"rows":[' + b",".join(b'{"depth":%d}' % i for i in range(200)) + b']}')
+
+
+def request(**headers):
+    return Request({
+        "type": "http", "method": "GET", "path": "/",
+        "headers": [(name.replace("_", "-").encode(), value.encode()) for name, value in headers.items()],
+    })
+
+
+def test_etag_differs_per_content_coding():
+    identity = BODY.response(request())
+    gzipped = BODY.response(request(accept_encoding="gzip"))
+    assert gzipped.headers["Content-Encoding"] == "gzip"
+    assert gzip.decompress(gzipped.body) == identity.body
+    assert identity.headers["ETag"] != gzipped.headers["ETag"]
+    assert gzipped.headers["ETag"].endswith('-gzip"')
+
+
+@pytest.mark.parametrize("if_none_match, status", [
+    ('"other", {etag}', 304),
+    ('W/{etag}', 304),
+    ('*', 304),
+    ('"other"', 200),
+    ('{identity}', 200),  # the identity validator does not match the gzip body
+])
+def test_if_none_match_is_parsed_as_a_list(if_none_match, status):
+    etag = BODY.etags["gzip"]
+    header = if_none_match.format(etag=etag, identity=BODY.etags["identity"])
+    response = BODY.response(request(accept_encoding="gzip", if_none_match=header))
+    assert response.status_code == status
+    assert response.headers["ETag"] == etag
@@ -0,0 +1,119 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from dive_log_service import DiveLogReducer, DiveLogService  # noqa: E402
+
+SAMPLE_SECONDS = 10
+
+
+def profile(*legs, start=0.0):
+    """
+    Samples every SAMPLE_SECONDS along (depth, seconds) legs, each travelled
+    linearly from the previous leg's depth, starting at the surface
+    """
+    times = [start]
+    depths = [0.0]
+    for depth, seconds in legs:
+        steps = int(seconds // SAMPLE_SECONDS)
+        times.extend(times[-1] + SAMPLE_SECONDS * np.arange(1, steps + 1))
+        depths.extend(np.linspace(depths[-1], depth, steps + 1)[1:])
+    return np.array(times, dtype=float), np.array(depths, dtype=float)
+
+
+def reduce(times, depths):
+    reducer = DiveLogReducer()
+    return reducer.feed(times, depths) + reducer.finish()
+
+
+def to_csv(times, depths):
+    return ("time,depth\n" + "".join(f"{t:g},{d:.1f}\n" for t, d in zip(times, depths))).encode()
+
+
+# 2 min descent to 30 m, 25 min on the bottom, 9 m/min ascent
+FLAT_DIVE = ((30.0, 120), (30.0, 1500), (0.0, 200))
+
+
+def test_flat_bottom_counts_until_final_ascent():
+    dives = reduce(*profile(*FLAT_DIVE))
+    assert len(dives) == 1
+    assert dives[0]["maxDepth"] == 30.0
+    assert dives[0]["bottomTime"] == 27
+
+
+def test_quantized_bottom_counts_until_final_ascent():
+    times, depths = profile(*FLAT_DIVE)
+    bottom = (times > 120) & (times <= 1620)
+    noise = np.resize([0.1, -0.1, 0.0], int(bottom.sum()))
+    depths[bottom] = np.round(depths[bottom] + noise, 1)
+
+    dive = reduce(times, depths)[0]
+    assert dive["maxDepth"] == 30.1
+    assert dive["bottomTime"] == 27
+
+
+def test_slow_ascent_is_not_bottom_time_above_safety_stop_depth():
+    # 3 min safety stop at 5 m after a regular ascent
+    dive = reduce(*profile((30.0, 120), (30.0, 1500), (5.0, 170), (5.0, 180), (0.0, 40)))[0]
+    assert dive["bottomTime"] == 27
+
+
+def test_multi_level_profile_counts_shallower_levels():
+    # 10 min at 30 m, then 20 min at 18 m before the final ascent
+    dive = reduce(*profile((30.0, 120), (30.0, 600), (18.0, 80), (18.0, 1200), (0.0, 120)))[0]
+    assert dive["maxDepth"] == 30.0
+    assert 33 <= dive["bottomTime"] <= 34
+
+
+def test_surface_interval_splits_dives():
+    first = profile(*FLAT_DIVE)
+    second = profile((20.0, 120), (20.0, 600), (0.0, 140), start=first[0][-1] + 3600)
+    times = np.concatenate([first[0], second[0]])
+    depths = np.concatenate([first[1], second[1]])
+
+    dives = reduce(times, depths)
+    assert [(dive["maxDepth"], dive["bottomTime"]) for dive in dives] == [(30.0, 27), (20.0, 12)]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1000, 1 << 20])
+def test_csv_chunk_splitting_does_not_change_result(chunk_size):
+    first = profile(*FLAT_DIVE)
+    second = profile((20.0, 120), (20.0, 600), (0.0, 140), start=first[0][-1] + 3600)
+    data = to_csv(np.concatenate([first[0], second[0]]), np.concatenate([first[1], second[1]]))
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    dives = list(DiveLogService().reduce_dive_log(chunks, "csv"))
+    assert [(dive.maxDepth, dive.bottomTime) for dive in dives] == [(30.0, 27), (20.0, 12)]
+
+
+@pytest.mark.parametrize("chunk_size", [5, 100, 1 << 20])
+def test_xml_dive_elements_are_dive_boundaries(chunk_size):
+    # Two dives a short time apart would merge by time; the <dive> elements keep them apart
+    first = profile((20.0, 120), (20.0, 600), (0.0, 140))
+    second = profile((12.0, 60), (12.0, 900), (0.0, 80), start=first[0][-1] + 60)
+
+    def dive_xml(times, depths):
+        waypoints = "".join(
+            f"<waypoint><divetime>{t:g}</divetime><depth>{d:.1f}</depth></waypoint>" for t, d in zip(times, depths)
+        )
+        return f"<dive><samples>{waypoints}</samples></dive>"
+
+    data = f"<uddf><profiledata>{dive_xml(*first)}{dive_xml(*second)}</profiledata></uddf>".encode()
+    chunks = [data[i:i + chunk_size] for i in range(0, len(data), chunk_size)]
+
+    dives = list(DiveLogService().reduce_dive_log(chunks, "xml"))
+    assert [(dive.maxDepth, dive.bottomTime) for dive in dives] == [(20.0, 12), (12.0, 16)]
+
+
+@pytest.mark.parametrize("data", [
+    b"time,depth\n0,0\n10,5,1\n20\n30,12\n",  # ragged lines whose value counts balance out
+    b"time,depth\n0,0\n10\n",
+    b"0,0\n10,5,1\n",
+])
+def test_csv_ragged_lines_are_rejected(data):
+    with pytest.raises(Exception, match="columnas por línea"):
+        list(DiveLogService().reduce_dive_log([data], "csv"))
@@ -0,0 +1,63 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'backend'))
+
+from models import SchedulePhase  # noqa: E402
+from oxygen_exposure import (  # noqa: E402
+    accumulate_daily, exposure_warnings, minutes_above_noaa_range, phases_exposure, segment_exposure
+)
+
+
+def test_segment_exposure_uses_noaa_limits():
+    cns, otu = segment_exposure([1.6, 1.4, 1.0, 1.45], [45, 75, 60, 10])
+    # 1.45 ata interpolates between the 150 and 120 min limits
+    assert cns == pytest.approx([100.0, 50.0, 20.0, 10 / 135 * 100])
+    assert otu[2] == pytest.approx(60.0)
+    assert otu[0] == pytest.approx(45 * 2.2 ** (5 / 6))
+
+
+def test_segment_exposure_ignores_low_ppo2():
+    cns, otu = segment_exposure([0.21, 0.5, 0.55], [600, 600, 60])
+    assert cns[:2].tolist() == [0.0, 0.0]
+    assert otu[:2].tolist() == [0.0, 0.0]
+    assert cns[2] > 0 and otu[2] > 0
+
+
+def test_ppo2_above_noaa_range_is_flagged_not_hidden():
+    ppo2 = np.array([1.61, 1.9, 2.5])
+    minutes = np.array([30.0, 20.0, 10.0])
+    cns, _ = segment_exposure(ppo2, minutes)
+    # Charged at the 1.6 ata limit: a lower bound, so the minutes are reported
+    assert cns == pytest.approx(minutes / 45 * 100)
+    assert minutes_above_noaa_range(ppo2, minutes).tolist() == [0.0, 20.0, 10.0]
+    assert any("1.6 ata" in warning for warning in exposure_warnings(10, 10, 30))
+    assert exposure_warnings(10, 10, 0) == []
+
+
+def test_phases_breathe_bottom_gas_except_oxygen():
+    phases = [
+        SchedulePhase(type='stop', depth=10.0, duration=600, gas='Aire', description=''),
+        SchedulePhase(type='o2_period', depth=6.1, duration=1800, gas='O₂', description=''),
+    ]
+    air = phases_exposure(phases)
+    nitrox = phases_exposure(phases, bottom_gas_fraction=0.36)
+    assert nitrox.otu > air.otu
+    assert nitrox.maxPpO2 == air.maxPpO2 == 1.61
+    assert air.minutesAboveNoaaRange == 0
+
+
+def test_accumulate_daily_decays_cns_with_half_life():
+    running_cns, running_otu = accumulate_daily([40.0, 20.0, 10.0], [50.0, 30.0, 5.0], [0, 90, 180])
+    assert running_cns[0] == pytest.approx(40.0)
+    assert running_cns[1] == pytest.approx(40.0 / 2 + 20.0)
+    assert running_cns[2] == pytest.approx((40.0 / 2 + 20.0) / 4 + 10.0)
+    assert running_otu.tolist() == [50.0, 80.0, 85.0]
+
+
+def test_accumulate_daily_long_intervals_wash_out():
+    running_cns, _ = accumulate_daily([80.0, 10.0], [0.0, 0.0], [0, 10 ** 6])
+    assert running_cns[1] == pytest.approx(10.0)